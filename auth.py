@@ -1,12 +1,12 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Header
-from typing import Optional
+from typing import Optional, NamedTuple
 import jwt
 from jwt.exceptions import InvalidTokenError as JWTError
+from services.passwords import pwd_context, check_password_length
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
+# Password hashing: these run inline (scripts); the API goes through
+# services.passwords.hash_password_async / verify_and_update_async
 
 # JWT settings
 SECRET_KEY = "12345678"  # Change this to something more secure in production!
@@ -14,21 +14,34 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 def hash_password(password: str) -> str:
-    if len(password.encode('utf-8')) > 72:
-        raise ValueError("Password is too long. Please use a shorter password.")
+    check_password_length(password)
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict):
+class Principal(NamedTuple):
+    """The authenticated caller, straight from the token (no DB lookup)"""
+    username: str
+    user_id: Optional[int] = None  # None for tokens issued before "uid" was added
+
+def create_access_token(data: dict, user_id: Optional[int] = None):
     to_encode = data.copy()
+    if user_id is not None:
+        to_encode["uid"] = user_id
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(authorization: Optional[str] = Header(None)):
+def _principal_from_payload(payload: dict) -> Optional[Principal]:
+    username = payload.get("sub")
+    if username is None:
+        return None
+    user_id = payload.get("uid")
+    return Principal(username=username, user_id=user_id if isinstance(user_id, int) else None)
+
+def get_current_user(authorization: Optional[str] = Header(None)) -> Principal:
     """
     Get the current logged-in user from the JWT token.
     Raises 401 if token is invalid.
@@ -46,16 +59,16 @@ def get_current_user(authorization: Optional[str] = Header(None)):
         # Authorization header format: "Bearer <token>"
         token = authorization.split(" ")[1]
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        principal = _principal_from_payload(payload)
+        if principal is None:
             raise credentials_exception
-        return username
+        return principal
     except (JWTError, IndexError):
         raise credentials_exception
 
-def get_current_user_optional(authorization: Optional[str] = Header(None)):
+def get_current_user_optional(authorization: Optional[str] = Header(None)) -> Optional[Principal]:
     """
-    Returns username if valid token is provided, None otherwise.
+    Returns the Principal if valid token is provided, None otherwise.
     Allows endpoints to work for both logged-in and anonymous users.
     """
     if not authorization:
@@ -64,7 +77,6 @@ def get_current_user_optional(authorization: Optional[str] = Header(None)):
     try:
         token = authorization.split(" ")[1]
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        return username
+        return _principal_from_payload(payload)
     except (JWTError, IndexError):
         return None
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Compare the old and new annotation renderers.
+
+Run from the repo root:
+    python -m benchmarks.bench_annotation
+"""
+import os
+import random
+import tempfile
+import time
+from PIL import Image, ImageDraw, ImageFont
+from services.image_processor import draw_detections, ANNOTATED_SUFFIX
+
+IMAGE_SIZE = (4032, 3024)  # 12 MP phone photo
+BOX_COUNTS = (0, 50, 500)
+ROUNDS = 5
+
+
+def legacy_draw_detections(image_path, predictions, output_path, model_sources=None):
+    """The renderer as it was before the cached font/colour tables (kept for comparison)"""
+    img = Image.open(image_path)
+    draw = ImageDraw.Draw(img)
+    source_colors = {'primary': (255, 0, 0), 'secondary': (0, 150, 255), 'default': (255, 107, 107)}
+    class_colors = {'Pimples': '#FF6B6B', 'Acne': '#FF6B6B', 'blackhead': '#4ECDC4', 'rosacea': '#FF69B4'}
+    try:
+        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
+    except:
+        font = ImageFont.load_default()
+    for idx, pred in enumerate(predictions):
+        left = pred['x'] - pred['width'] / 2
+        top = pred['y'] - pred['height'] / 2
+        right = pred['x'] + pred['width'] / 2
+        bottom = pred['y'] + pred['height'] / 2
+        class_name = pred.get('class', 'unknown')
+        if model_sources and idx < len(model_sources):
+            color = source_colors.get(model_sources[idx], source_colors['default'])
+        else:
+            color_hex = class_colors.get(class_name, '#FF6B6B')
+            color = tuple(int(color_hex.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+        draw.rectangle([(left, top), (right, bottom)], outline=color, width=3)
+        label = f"{class_name} {pred['confidence']*100:.0f}%"
+        bbox = draw.textbbox((left, top), label, font=font)
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        draw.rectangle([(left, top - text_height - 4), (left + text_width + 8, top)], fill=color)
+        draw.text((left + 4, top - text_height - 2), label, fill=(255, 255, 255), font=font)
+    img.save(output_path)
+    return output_path
+
+
+def make_predictions(count):
+    rng = random.Random(count)
+    classes = ["Acne", "Pimples", "blackhead", "rosacea"]
+    return [
+        {
+            "x": rng.uniform(100, IMAGE_SIZE[0] - 100),
+            "y": rng.uniform(100, IMAGE_SIZE[1] - 100),
+            "width": rng.uniform(20, 120),
+            "height": rng.uniform(20, 120),
+            "confidence": rng.uniform(0.1, 0.99),
+            "class": rng.choice(classes),
+        }
+        for _ in range(count)
+    ]
+
+
+def timed(fn, rounds=ROUNDS):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, "source.png")
+        Image.effect_noise(IMAGE_SIZE, 40).convert("RGB").save(source_path)
+        decoded = Image.open(source_path).convert("RGB")
+        
+        print(f"{'boxes':>6} {'old (ms)':>10} {'old KB':>8} {'new (ms)':>10} {'new KB':>8} {'speedup':>8}")
+        for count in BOX_COUNTS:
+            predictions = make_predictions(count)
+            sources = ["primary" if i % 2 else "secondary" for i in range(count)]
+            old_out = os.path.join(tmp, f"old_{count}.png")
+            new_out = os.path.join(tmp, f"new_{count}{ANNOTATED_SUFFIX}")
+            
+            # Old path: reopen the upload from disk, draw full-res, save with default PNG settings
+            old = timed(lambda: legacy_draw_detections(source_path, predictions, old_out, sources))
+            # New path: reuse the decoded image (draw_detections draws on a capped copy)
+            new = timed(lambda: draw_detections(decoded, predictions, new_out, sources))
+            
+            print(
+                f"{count:>6} {old * 1000:>10.1f} {os.path.getsize(old_out) // 1024:>8} "
+                f"{new * 1000:>10.1f} {os.path.getsize(new_out) // 1024:>8} {old / new:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
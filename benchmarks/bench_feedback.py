@@ -0,0 +1,185 @@
+"""
+Feedback rule engine (services/feedback.py) vs the hand-written
+generate_feedback_multi it replaced.
+
+First checks that both give identical (severity, feedback, recommendations):
+for every subset of the classes the rules look at (plus an unknown one),
+with counts around each threshold, then on random summaries. Exits non-zero
+on the first mismatch. Then times both over a mix of summaries.
+
+Run from the repo root:
+    python -m benchmarks.bench_feedback
+"""
+import sys
+import time
+import random
+import itertools
+from services.feedback import CompiledRules, DEFAULT_RULES
+
+CLASSES = ["cystic", "purulent", "Acne", "conglobata", "Pimples", "blackhead", "whitehead", "acne_scars", "milium", "papular", "keloid"]
+COUNTS = (0, 1, 2, 3, 4, 5, 6, 15, 16)
+RANDOM_CASES = 20000
+ROUNDS = 5
+
+
+def legacy_feedback(detection_summary: dict, avg_confidence: float):
+    """generate_feedback_multi before the rule engine"""
+    total_concerns = sum(detection_summary.values())
+    
+    if total_concerns == 0:
+        return "clear", "Great news! No skin concerns detected. Your skin looks healthy!", [
+            "Maintain your current skincare routine",
+            "Continue using sunscreen daily (SPF 30+)",
+            "Stay hydrated and get adequate sleep",
+            "Cleanse gently twice daily"
+        ]
+    
+    concerns = []
+    for condition_type, count in detection_summary.items():
+        readable_name = condition_type.replace('_', ' ').title()
+        concerns.append(f"{count} {readable_name}")
+    
+    concern_text = ", ".join(concerns)
+    feedback = f"Analysis detected: {concern_text}."
+    
+    recommendations = []
+    seen_recommendations = set()
+    
+    if any(key in detection_summary for key in ['cystic', 'purulent', 'Acne', 'conglobata', 'Pimples']):
+        recs = [
+            "Use a gentle cleanser with salicylic acid (2%) or benzoyl peroxide (2.5-5%)",
+            "Apply spot treatment to active breakouts",
+            "Avoid touching or picking at your face",
+            "Change pillowcases regularly"
+        ]
+        for rec in recs:
+            if rec not in seen_recommendations:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if any(key in detection_summary for key in ['cystic', 'purulent', 'conglobata']):
+        if detection_summary.get('cystic', 0) + detection_summary.get('purulent', 0) > 3:
+            rec = "Consider consulting a dermatologist for prescription treatments (this may require professional care)"
+            if rec not in seen_recommendations:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if 'blackhead' in detection_summary:
+        recs = [
+            "Use a BHA (salicylic acid) exfoliant 2-3 times per week",
+            "Try oil cleansing to help dissolve sebum",
+            "Consider professional extractions for stubborn blackheads"
+        ]
+        for rec in recs:
+            if rec not in seen_recommendations:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if 'whitehead' in detection_summary:
+        recs = [
+            "Use products with salicylic acid to unclog pores",
+            "Avoid heavy, pore-clogging moisturizers",
+            "Don't squeeze whiteheads - let them heal naturally"
+        ]
+        for rec in recs:
+            if rec not in seen_recommendations:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if 'acne_scars' in detection_summary:
+        recs = [
+            "Apply vitamin C serum to help fade scarring",
+            "Use products with niacinamide for skin repair",
+            "Always wear SPF 30+ to prevent darkening of scars",
+            "Consider professional treatments (microneedling, laser) for severe scarring"
+        ]
+        for rec in recs:
+            if rec not in seen_recommendations:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if 'milium' in detection_summary:
+        rec = "Milia may require professional extraction - avoid trying to remove them yourself"
+        if rec not in seen_recommendations:
+            recommendations.append(rec)
+            seen_recommendations.add(rec)
+    
+    if len(recommendations) < 3:
+        general_recs = [
+            "Maintain a consistent skincare routine",
+            "Avoid harsh scrubbing or over-exfoliation",
+            "Keep hair and hands away from your face"
+        ]
+        for rec in general_recs:
+            if rec not in seen_recommendations and len(recommendations) < 5:
+                recommendations.append(rec)
+                seen_recommendations.add(rec)
+    
+    if total_concerns == 0:
+        severity = "clear"
+    elif total_concerns <= 5:
+        severity = "mild"
+    elif total_concerns <= 15:
+        severity = "moderate"
+    else:
+        severity = "severe"
+    
+    return severity, feedback, recommendations
+
+
+def exhaustive_summaries():
+    """Every subset of CLASSES, each count pattern drawn from COUNTS for the first two members"""
+    rng = random.Random(11)
+    yield {}
+    for size in range(1, len(CLASSES) + 1):
+        for names in itertools.combinations(CLASSES, size):
+            for first, second in itertools.product(COUNTS, repeat=2) if size > 1 else ((c, 0) for c in COUNTS):
+                counts = [first, second] + [rng.choice(COUNTS) for _ in names[2:]]
+                yield dict(zip(names, counts))
+
+
+def random_summary(rng: random.Random, max_count=20, max_classes=len(CLASSES)):
+    names = rng.sample(CLASSES, rng.randint(0, max_classes))
+    rng.shuffle(names)
+    return {name: rng.randint(0, max_count) for name in names}
+
+
+def check_equivalence(rules: CompiledRules):
+    rng = random.Random(2024)
+    cases = list(exhaustive_summaries()) + [random_summary(rng) for _ in range(RANDOM_CASES)]
+    for case in cases:
+        want = legacy_feedback(case, 0.5)
+        got = rules.evaluate(case)
+        if want != got:
+            print(f"❌ mismatch for {case}:\n  legacy={want}\n  engine={got}")
+            sys.exit(1)
+    print(f"✅ feedback: {len(cases)} cases identical")
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench(rules: CompiledRules):
+    rng = random.Random(7)
+    mixes = {
+        "up to 3 classes (us)": [random_summary(rng, max_count=8, max_classes=3) for _ in range(10000)],
+        f"up to {len(CLASSES)} classes (us)": [random_summary(rng) for _ in range(10000)],
+    }
+    
+    print(f"{'feedback per summary':<28} {'legacy':>12} {'engine':>12}")
+    for label, summaries in mixes.items():
+        legacy = best_of(lambda: [legacy_feedback(s, 0.5) for s in summaries]) / len(summaries)
+        engine = best_of(lambda: [rules.evaluate(s) for s in summaries]) / len(summaries)
+        print(f"{label:<28} {legacy * 1e6:>12.1f} {engine * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    compiled = CompiledRules(DEFAULT_RULES)
+    check_equivalence(compiled)
+    bench(compiled)
@@ -0,0 +1,154 @@
+"""
+Login throughput and its effect on concurrent /api/analyze latency.
+
+Runs the app in-process against a temporary SQLite DB and a local stub
+detector (no Roboflow calls), and compares:
+  - analyze only (baseline)
+  - analyze during a login burst, bcrypt inline on the event loop (old behaviour)
+  - analyze during a login burst, bcrypt in the password process pool
+
+Run from the repo root:
+    python -m benchmarks.bench_login
+"""
+import os
+import io
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LOGINS = 48
+LOGIN_CONCURRENCY = 16
+ANALYZES = 24
+ANALYZE_CONCURRENCY = 4
+DETECTOR_DELAY = 0.05  # seconds the stub detector "thinks" per call
+
+
+class StubDetector(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(DETECTOR_DELAY)
+        body = json.dumps({"predictions": [
+            {"x": 120, "y": 90, "width": 30, "height": 30, "confidence": 0.8, "class": "Acne"}
+        ]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDetector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_jpeg(seed: int) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    # A different image per request so the inference cache doesn't hide the detector round-trip
+    Image.effect_noise((1280, 960), 30 + seed % 20).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_limited(count, concurrency, make_call):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await make_call(i)
+            latencies.append(time.perf_counter() - start)
+    
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies
+
+
+async def scenario(client, images, logins):
+    async def analyze(i):
+        r = await client.post("/api/analyze", files={"file": (f"face{i}.jpg", images[i], "image/jpeg")})
+        assert r.status_code == 200, r.text
+    
+    async def login(i):
+        r = await client.post("/login", json={"username": "bench", "password": "bench-password"})
+        assert r.status_code == 200, r.text
+    
+    started = time.perf_counter()
+    analyze_task = asyncio.ensure_future(run_limited(ANALYZES, ANALYZE_CONCURRENCY, analyze))
+    login_task = asyncio.ensure_future(run_limited(LOGINS if logins else 0, LOGIN_CONCURRENCY, login))
+    analyze_latencies = await analyze_task
+    await login_task
+    login_elapsed = time.perf_counter() - started
+    return analyze_latencies, (LOGINS / login_elapsed if logins else None)
+
+
+async def bench():
+    import httpx
+    import main
+    from services import passwords
+    
+    main.startup()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        r = await client.post("/register", json={"username": "bench", "email": "bench@example.com", "password": "bench-password"})
+        assert r.status_code == 200, r.text
+        # Warm the process pool and the detector connection pool
+        await client.post("/login", json={"username": "bench", "password": "bench-password"})
+        
+        images = [make_jpeg(i) for i in range(ANALYZES * 3)]
+        pooled = main.verify_and_update_async
+        
+        async def inline(plain_password, hashed_password):
+            return passwords.pwd_context.verify_and_update(plain_password, hashed_password)
+        
+        rows = []
+        baseline, _ = await scenario(client, images[:ANALYZES], logins=False)
+        rows.append(("analyze only", baseline, None))
+        
+        main.verify_and_update_async = inline
+        latencies, rate = await scenario(client, images[ANALYZES:ANALYZES * 2], logins=True)
+        rows.append(("+ logins, bcrypt inline", latencies, rate))
+        
+        main.verify_and_update_async = pooled
+        latencies, rate = await scenario(client, images[ANALYZES * 2:], logins=True)
+        rows.append(("+ logins, process pool", latencies, rate))
+    
+    await main.shutdown()
+    
+    print(f"bcrypt rounds={passwords.BCRYPT_ROUNDS}, password workers={passwords.PASSWORD_POOL_WORKERS}, "
+          f"{LOGINS} logins x{LOGIN_CONCURRENCY}, {ANALYZES} analyzes x{ANALYZE_CONCURRENCY}")
+    print(f"{'scenario':<26} {'logins/s':>9} {'analyze p50 (ms)':>17} {'analyze p95 (ms)':>17}")
+    for name, latencies, rate in rows:
+        print(
+            f"{name:<26} {(f'{rate:.1f}' if rate else '-'):>9} "
+            f"{statistics.median(latencies) * 1000:>17.1f} {percentile(latencies, 95) * 1000:>17.1f}"
+        )
+
+
+def run():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = ""
+        os.environ["ROBOFLOW_API_URL"] = start_stub()
+        os.environ.setdefault("ROBOFLOW_API_KEY", "bench")
+        os.environ.setdefault("ROBOFLOW_MODEL", "bench-model")
+        os.chdir(tmp)  # SQLite DB and annotation files land in the temp dir
+        asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,223 @@
+"""
+Scoring engine (services/scoring.py) vs the per-call functions it replaced.
+
+First checks that both give identical scores: exhaustively for one and two
+classes over a range of counts, then on random summaries, with and without
+box fusion. Exits non-zero on the first mismatch. Then times a single call
+and a bulk run (one call over many summaries vs a loop over the old functions).
+
+Run from the repo root:
+    python -m benchmarks.bench_scoring
+"""
+import sys
+import time
+import random
+import itertools
+from services.scoring import (
+    skin_score, secondary_score, combined_score,
+    skin_scores, secondary_scores, combined_scores,
+    PRIMARY_WEIGHTS, SECONDARY_WEIGHTS,
+)
+
+PRIMARY_CLASSES = list(PRIMARY_WEIGHTS) + ["freckle_like", "unknown"]
+SECONDARY_CLASSES = list(SECONDARY_WEIGHTS) + ["ACNE", "vitiligo"]
+RANDOM_CASES = 20000
+BULK_SIZE = 10000
+ROUNDS = 5
+
+
+def legacy_skin_score(detection_summary: dict, avg_confidence: float) -> int:
+    """calculate_skin_score_multi before the scoring engine (debug prints removed)"""
+    base_score = 95
+    total_penalty = 0
+    
+    severity_weights = {
+        'cystic': 8,
+        'purulent': 7,
+        'Acne': 6,
+        'conglobata': 8,
+        'Pimples': 5,
+        'papular': 5,
+        'whitehead': 4,
+        'blackhead': 4,
+        'acne_scars': 4,
+        'keloid': 5,
+        'folliculitis': 3,
+        'milium': 2,
+        'crystalline': 2,
+        'flat_wart': 3,
+        'syringoma': 2,
+        'sebo-crystan-conglo': 5,
+    }
+    
+    for condition_type, count in detection_summary.items():
+        weight = severity_weights.get(condition_type, 4)
+        
+        if count <= 2:
+            penalty = count * weight
+        elif count <= 5:
+            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
+        elif count <= 10:
+            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
+        else:
+            penalty = (2 * weight) + (3 * weight * 1.2) + (5 * weight) + ((count - 10) * (weight * 0.8))
+        
+        total_penalty += penalty
+    
+    total_penalty = min(total_penalty, 70)
+    final_score = base_score - total_penalty
+    return max(30, min(95, int(final_score)))
+
+
+def legacy_secondary_score(detection_summary: dict, avg_confidence: float) -> int:
+    """calculate_secondary_score before the scoring engine (debug prints removed)"""
+    base_score = 95
+    total_penalty = 0
+    
+    secondary_weights = {
+        'acne': 6,
+        'Acne': 6,
+        'melasma': 7,
+        'Melasma': 7,
+        'rosacea': 8,
+        'Rosacea': 8,
+    }
+    
+    for condition_type, count in detection_summary.items():
+        weight = secondary_weights.get(condition_type, 5)
+        
+        if count <= 2:
+            penalty = count * weight
+        elif count <= 5:
+            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
+        else:
+            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
+        
+        total_penalty += penalty
+    
+    total_penalty = min(total_penalty, 70)
+    final_score = base_score - total_penalty
+    
+    return max(30, min(95, int(final_score)))
+
+
+def legacy_combine_scores(primary_score: int, primary_summary: dict, secondary_score: int, secondary_summary: dict, fused: bool = False) -> int:
+    """combine_scores before the scoring engine (debug prints removed)"""
+    combined = primary_score
+    
+    secondary_weights = {
+        'acne': 6,
+        'Acne': 6,
+        'melasma': 7,
+        'Melasma': 7,
+        'rosacea': 8,
+        'Rosacea': 8,
+    }
+    
+    has_primary_acne = any(
+        key in primary_summary 
+        for key in ['Acne', 'Pimples', 'papular', 'cystic', 'purulent', 'conglobata']
+    )
+    
+    additional_penalty = 0
+    unique_conditions = []
+    
+    for condition_type, count in secondary_summary.items():
+        condition_lower = condition_type.lower()
+        is_acne_condition = condition_lower in ['acne'] or condition_type in ['Acne']
+        
+        if is_acne_condition and has_primary_acne and not fused:
+            continue
+        
+        weight = secondary_weights.get(condition_type, 5)
+        
+        if count <= 2:
+            penalty = count * weight
+        elif count <= 5:
+            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
+        else:
+            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
+        
+        additional_penalty += penalty
+        unique_conditions.append(f"{count}x {condition_type}")
+    
+    combined = primary_score - int(additional_penalty)
+    combined = max(30, min(95, combined))
+    
+    return combined
+
+
+def random_summary(rng: random.Random, classes, max_classes=6, max_count=40):
+    names = rng.sample(classes, rng.randint(0, min(max_classes, len(classes))))
+    return {name: rng.randint(0 if rng.random() < 0.05 else 1, max_count) for name in names}
+
+
+def exhaustive_summaries(classes, max_count):
+    for name in classes:
+        for count in range(max_count + 1):
+            yield {name: count}
+    for first, second in itertools.permutations(classes, 2):
+        for first_count, second_count in itertools.product(range(16), repeat=2):
+            yield {first: first_count, second: second_count}
+
+
+def check(label, expected, actual, cases):
+    for case, want, got in zip(cases, expected, actual):
+        if want != got:
+            print(f"❌ {label} mismatch for {case}: legacy={want}, engine={got}")
+            sys.exit(1)
+    print(f"✅ {label}: {len(cases)} cases identical")
+
+
+def check_equivalence():
+    rng = random.Random(2024)
+    
+    primary_cases = list(exhaustive_summaries(PRIMARY_CLASSES, 100)) + [random_summary(rng, PRIMARY_CLASSES) for _ in range(RANDOM_CASES)]
+    expected = [legacy_skin_score(s, 0.5) for s in primary_cases]
+    check("skin score", expected, [skin_score(s) for s in primary_cases], primary_cases)
+    check("skin scores (bulk)", expected, skin_scores(primary_cases).tolist(), primary_cases)
+    
+    secondary_cases = list(exhaustive_summaries(SECONDARY_CLASSES, 100)) + [random_summary(rng, SECONDARY_CLASSES) for _ in range(RANDOM_CASES)]
+    expected = [legacy_secondary_score(s, 0.5) for s in secondary_cases]
+    check("secondary score", expected, [secondary_score(s) for s in secondary_cases], secondary_cases)
+    check("secondary scores (bulk)", expected, secondary_scores(secondary_cases).tolist(), secondary_cases)
+    
+    pairs = [(random_summary(rng, PRIMARY_CLASSES), random_summary(rng, SECONDARY_CLASSES)) for _ in range(RANDOM_CASES)]
+    primary = [p for p, _ in pairs]
+    secondary = [s for _, s in pairs]
+    base_scores = [rng.randint(30, 95) for _ in pairs]
+    for fused in (False, True):
+        expected = [legacy_combine_scores(score, p, 0, s, fused) for score, p, s in zip(base_scores, primary, secondary)]
+        single = [combined_score(score, p, s, fused) for score, p, s in zip(base_scores, primary, secondary)]
+        check(f"combined score (fused={fused})", expected, single, pairs)
+        check(f"combined scores (bulk, fused={fused})", expected, combined_scores(base_scores, primary, secondary, fused).tolist(), pairs)
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench():
+    rng = random.Random(7)
+    summaries = [random_summary(rng, PRIMARY_CLASSES, max_count=12) for _ in range(BULK_SIZE)]
+    single = summaries[0]
+    calls = 2000
+    
+    legacy_single = best_of(lambda: [legacy_skin_score(single, 0.5) for _ in range(calls)]) / calls
+    engine_single = best_of(lambda: [skin_score(single) for _ in range(calls)]) / calls
+    legacy_bulk = best_of(lambda: [legacy_skin_score(s, 0.5) for s in summaries])
+    engine_bulk = best_of(lambda: skin_scores(summaries))
+    
+    print(f"{'skin score':<28} {'legacy':>12} {'engine':>12}")
+    print(f"{'single summary (us)':<28} {legacy_single * 1e6:>12.1f} {engine_single * 1e6:>12.1f}")
+    print(f"{f'{BULK_SIZE} summaries (ms)':<28} {legacy_bulk * 1e3:>12.1f} {engine_bulk * 1e3:>12.1f}")
+
+
+if __name__ == "__main__":
+    check_equivalence()
+    bench()
@@ -0,0 +1,207 @@
+"""
+Behaviour checks for the pooled Roboflow client (services/http_client.py)
+against a local stub server standing in for Roboflow:
+  - 429/5xx and dropped connections are retried with jittered backoff,
+    Retry-After is honoured, 4xx is returned as-is
+  - a timed-out attempt is retried within the call's budget, and the call
+    gives up once the budget is spent
+  - sequential calls reuse one keep-alive connection (sync and async)
+  - the secondary-model circuit breaker opens after repeated failures,
+    skips calls while open and closes again after a successful trial call
+
+Exits non-zero on the first failed check.
+
+Run from the repo root:
+    python -m benchmarks.check_http_client
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from collections import defaultdict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 0.5
+BREAKER_FAILURES = 3
+BREAKER_RESET = 0.5
+
+# Scripted responses per path: ("status", code, headers) | ("sleep", seconds) | ("drop",).
+# Paths with an empty script answer FALLBACK[path], else 200.
+SCRIPT = defaultdict(deque)
+FALLBACK = {}
+HITS = defaultdict(list)  # path -> client port of every request received
+
+
+class StubRoboflow(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        HITS[path].append(self.client_address[1])
+        action = SCRIPT[path].popleft() if SCRIPT[path] else FALLBACK.get(path, ("status", 200, {}))
+        
+        if action[0] == "drop":
+            self.close_connection = True
+            return
+        if action[0] == "sleep":
+            time.sleep(action[1])
+            action = ("status", 200, {})
+        _, status, headers = action
+        body = b'{"predictions": []}'
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+
+
+def start_stub() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRoboflow)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def check(label, ok, detail=""):
+    if not ok:
+        print(f"❌ {label} {detail}")
+        sys.exit(1)
+    print(f"✅ {label}")
+
+
+async def check_retries(base_url, http_client):
+    SCRIPT["/flaky"].extend([("status", 503, {}), ("status", 500, {})])
+    response = await http_client.post_with_retries_async(f"{base_url}/flaky", timeout=5)
+    check("5xx retried until success", response.status_code == 200 and len(HITS["/flaky"]) == 3, f"status={response.status_code} hits={len(HITS['/flaky'])}")
+    
+    FALLBACK["/down"] = ("status", 502, {})
+    response = await http_client.post_with_retries_async(f"{base_url}/down", timeout=5)
+    check("5xx returned after the last retry", response.status_code == 502 and len(HITS["/down"]) == http_client.HTTP_MAX_RETRIES + 1, f"hits={len(HITS['/down'])}")
+    
+    SCRIPT["/bad"].append(("status", 400, {}))
+    response = await http_client.post_with_retries_async(f"{base_url}/bad", timeout=5)
+    check("4xx not retried", response.status_code == 400 and len(HITS["/bad"]) == 1)
+    
+    SCRIPT["/busy"].append(("status", 429, {"Retry-After": "0.3"}))
+    started = time.perf_counter()
+    response = await http_client.post_with_retries_async(f"{base_url}/busy", timeout=5)
+    check("Retry-After honoured", response.status_code == 200 and time.perf_counter() - started >= 0.3)
+    
+    SCRIPT["/dropped"].append(("drop",))
+    response = await http_client.post_with_retries_async(f"{base_url}/dropped", timeout=5)
+    check("dropped connection retried", response.status_code == 200 and len(HITS["/dropped"]) == 2)
+    
+    delays = [http_client.backoff_delay(2) for _ in range(200)]
+    cap = min(BACKOFF_MAX, BACKOFF_BASE * 4)
+    check("backoff jittered within its cap", all(0 <= d <= cap for d in delays) and len(set(delays)) > 150)
+
+
+async def check_timeouts(base_url, http_client):
+    import httpx
+    import requests
+    
+    SCRIPT["/slow"].append(("sleep", 1.0))
+    started = time.perf_counter()
+    response = await http_client.post_with_retries_async(f"{base_url}/slow", timeout=3, attempt_timeout=0.3)
+    elapsed = time.perf_counter() - started
+    check("timed-out attempt retried (async)", response.status_code == 200 and len(HITS["/slow"]) == 2 and elapsed < 1.0, f"elapsed={elapsed:.2f}s")
+    
+    SCRIPT["/slow-sync"].append(("sleep", 1.0))
+    response = await asyncio.to_thread(http_client.post_with_retries, f"{base_url}/slow-sync", 3, 0.3)
+    check("timed-out attempt retried (sync)", response.status_code == 200 and len(HITS["/slow-sync"]) == 2)
+    
+    FALLBACK["/stalled"] = ("sleep", 2.0)
+    started = time.perf_counter()
+    try:
+        await http_client.post_with_retries_async(f"{base_url}/stalled", timeout=0.7, attempt_timeout=0.3)
+        raised = False
+    except httpx.TimeoutException:
+        raised = True
+    elapsed = time.perf_counter() - started
+    check("gives up when the budget is spent (async)", raised and elapsed < 1.2, f"raised={raised} elapsed={elapsed:.2f}s")
+    
+    FALLBACK["/stalled-sync"] = ("sleep", 2.0)
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(http_client.post_with_retries, f"{base_url}/stalled-sync", 0.7, 0.3)
+        raised = False
+    except requests.Timeout:
+        raised = True
+    elapsed = time.perf_counter() - started
+    check("gives up when the budget is spent (sync)", raised and elapsed < 1.2, f"raised={raised} elapsed={elapsed:.2f}s")
+
+
+async def check_keep_alive(base_url, http_client):
+    for _ in range(5):
+        await http_client.post_with_retries_async(f"{base_url}/reuse", timeout=5)
+    check("async calls reuse one connection", len(set(HITS["/reuse"])) == 1, f"ports={set(HITS['/reuse'])}")
+    
+    def sync_calls():
+        for _ in range(5):
+            http_client.post_with_retries(f"{base_url}/reuse-sync", 5)
+    await asyncio.to_thread(sync_calls)
+    check("sync calls reuse one connection", len(set(HITS["/reuse-sync"])) == 1, f"ports={set(HITS['/reuse-sync'])}")
+
+
+async def check_breaker(roboflow, http_client):
+    path = "/acne-melasma-rosacea/1"
+    FALLBACK[path] = ("status", 500, {})
+    for i in range(BREAKER_FAILURES):
+        try:
+            await roboflow.analyze_secondary_async(f"image {i}".encode())
+        except Exception:
+            pass
+    attempts = BREAKER_FAILURES * (http_client.HTTP_MAX_RETRIES + 1)
+    check("breaker opens after repeated failures", roboflow.secondary_breaker.stats()["state"] == "open" and len(HITS[path]) == attempts)
+    
+    try:
+        await roboflow.analyze_secondary_async(b"skipped")
+        skipped = False
+    except http_client.CircuitOpenError:
+        skipped = True
+    check("open breaker skips the call", skipped and len(HITS[path]) == attempts)
+    
+    await asyncio.sleep(BREAKER_RESET + 0.1)
+    FALLBACK[path] = ("status", 200, {})
+    await roboflow.analyze_secondary_async(b"trial")
+    check("successful trial call closes the breaker", roboflow.secondary_breaker.stats()["state"] == "closed" and len(HITS[path]) == attempts + 1)
+
+
+async def main():
+    base_url = start_stub()
+    os.environ.update({
+        "DATABASE_URL": "",
+        "ROBOFLOW_API_URL": base_url,
+        "ROBOFLOW_API_KEY": "stub",
+        "HTTP_MAX_RETRIES": "2",
+        "HTTP_BACKOFF_BASE": str(BACKOFF_BASE),
+        "HTTP_BACKOFF_MAX": str(BACKOFF_MAX),
+        "ROBOFLOW_SECONDARY_BREAKER_FAILURES": str(BREAKER_FAILURES),
+        "ROBOFLOW_SECONDARY_BREAKER_RESET": str(BREAKER_RESET),
+    })
+    from services import http_client, roboflow
+    
+    try:
+        await check_retries(base_url, http_client)
+        await check_timeouts(base_url, http_client)
+        await check_keep_alive(base_url, http_client)
+        await check_breaker(roboflow, http_client)
+    finally:
+        await http_client.close_clients()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the SQLite DB behind the inference cache lands here
+        asyncio.run(main())
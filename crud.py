@@ -0,0 +1,112 @@
+import os
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update, delete, or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import User, Analysis
+from services.cache import LRUCache
+from services import metrics
+
+# DB helpers that route handlers await on an AsyncSession (database.get_async_db).
+# History queries are built by the statement helpers below.
+
+# username -> user id for tokens that don't carry "uid". Usernames can't be
+# changed and users aren't deleted, so only the TTL bounds staleness.
+USER_CACHE_ENTRIES = int(os.getenv("USER_CACHE_ENTRIES", "4096"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+_user_ids = LRUCache(max_entries=USER_CACHE_ENTRIES, ttl=USER_CACHE_TTL)
+metrics.register("user_cache", _user_ids.stats)
+
+def encode_cursor(analysis: Analysis) -> str:
+    """Opaque keyset cursor for the position just after `analysis`"""
+    raw = json.dumps([analysis.created_at.isoformat(), analysis.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, analysis_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(analysis_id)
+    except (binascii.Error, TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _page_statement(user_id: int, limit: int, cursor: Optional[Tuple[datetime, int]]):
+    stmt = select(Analysis).where(Analysis.user_id == user_id)
+    if cursor is not None:
+        created_at, analysis_id = cursor
+        stmt = stmt.where(or_(
+            Analysis.created_at < created_at,
+            and_(Analysis.created_at == created_at, Analysis.id < analysis_id)
+        ))
+    # One extra row tells us whether there is a next page
+    return stmt.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(limit + 1)
+
+def _split_page(rows: List[Analysis], limit: int) -> Tuple[List[Analysis], Optional[str]]:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return list(rows), None
+
+def _count_statement(user_id: int):
+    return select(func.count(Analysis.id)).where(Analysis.user_id == user_id)
+
+def _delete_statement(user_id: int, analysis_id: int):
+    return delete(Analysis).where(Analysis.id == analysis_id, Analysis.user_id == user_id)
+
+async def get_user_by_username_async(db: AsyncSession, username: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.username == username))).scalars().first()
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.email == email))).scalars().first()
+
+async def get_user_id_by_username_async(db: AsyncSession, username: str) -> Optional[int]:
+    """Cached id lookup; unknown usernames are not cached"""
+    user_id = _user_ids.get(username)
+    if user_id is None:
+        user_id = (await db.execute(select(User.id).where(User.username == username))).scalar()
+        if user_id is not None:
+            _user_ids.set(username, user_id)
+    return user_id
+
+async def create_user_async(db: AsyncSession, username: str, email: str, hashed_password: str) -> User:
+    new_user = User(
+        username=username,
+        email=email,
+        hashed_password=hashed_password
+    )
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
+
+async def update_password_hash_async(db: AsyncSession, user_id: int, hashed_password: str):
+    await db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+    await db.commit()
+
+async def list_analyses_page_async(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[Tuple[datetime, int]] = None
+) -> Tuple[List[Analysis], Optional[str]]:
+    """
+    One page of a user's history, newest first, using keyset pagination on
+    (created_at DESC, id DESC) so cost doesn't grow with history length.
+    Returns (analyses, next_cursor); next_cursor is None on the last page.
+    """
+    rows = (await db.execute(_page_statement(user_id, limit, cursor))).scalars().all()
+    return _split_page(rows, limit)
+
+async def count_analyses_async(db: AsyncSession, user_id: int) -> int:
+    return (await db.execute(_count_statement(user_id))).scalar()
+
+async def delete_analysis_async(db: AsyncSession, user_id: int, analysis_id: int) -> bool:
+    """Single DELETE scoped to the owner; False if nothing matched"""
+    deleted = (await db.execute(_delete_statement(user_id, analysis_id))).rowcount
+    await db.commit()
+    return deleted > 0
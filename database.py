@@ -1,30 +1,151 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import exc, create_engine, event, make_url, Column, Integer, String, DateTime, Float, ForeignKey, Text, Index, JSON, inspect, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict
 import os
+import time
+import threading
+from services import metrics
+
+# Connection pool (per worker process; Railway Postgres caps total connections)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side cap per statement (Postgres); 0 disables
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+# How long SQLite waits on a locked database before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+_pool_lock = threading.Lock()
+# Kept outside the pool objects: engine.dispose() replaces the pool instance
+_pool_counters = {
+    name: {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0, "timeouts": 0}
+    for name in ("sync", "async")
+}
+
+class _CheckoutTimer:
+    """Pool mixin that records how long checkouts wait for a free (or newly opened) connection"""
+    counters_key = "sync"
+    
+    def _do_get(self):
+        counters = _pool_counters[self.counters_key]
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with _pool_lock:
+                counters["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with _pool_lock:
+                counters["checkouts"] += 1
+                counters["wait_total"] += waited
+                counters["wait_max"] = max(counters["wait_max"], waited)
+
+class InstrumentedQueuePool(_CheckoutTimer, QueuePool):
+    counters_key = "sync"
+
+class InstrumentedAsyncQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    counters_key = "async"
+
+pool_options = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
 
 # Get database URL from environment variable (Railway provides this)
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; busy_timeout retries instead of failing fast
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+# Two engines on the same database: the sync one for scripts (fix_severity.py)
+# and run_io helpers, the async one (aiosqlite / asyncpg) for route handlers.
 # If DATABASE_URL is not set (local development), use SQLite
 if not SQLALCHEMY_DATABASE_URL:
     SQLALCHEMY_DATABASE_URL = "sqlite:///./acne_analyzer.db"
+    sqlite_connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL, 
-        connect_args={"check_same_thread": False}
+        connect_args=sqlite_connect_args,
+        poolclass=InstrumentedQueuePool,
+        **pool_options
+    )
+    async_engine = create_async_engine(
+        make_url(SQLALCHEMY_DATABASE_URL).set(drivername="sqlite+aiosqlite"),
+        connect_args=sqlite_connect_args,
+        poolclass=InstrumentedAsyncQueuePool,
+        **pool_options
     )
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
 else:
     # PostgreSQL URL fix for SQLAlchemy (Railway uses postgres://, SQLAlchemy needs postgresql://)
     if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
         SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
     
     # Create engine for PostgreSQL
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    connect_args = {}
+    async_connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+        async_connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, poolclass=InstrumentedQueuePool, **pool_options)
+    
+    # asyncpg doesn't understand libpq's ?sslmode=; it takes the same values as `ssl`
+    async_url = make_url(SQLALCHEMY_DATABASE_URL).set(drivername="postgresql+asyncpg")
+    if "sslmode" in async_url.query:
+        async_connect_args["ssl"] = async_url.query["sslmode"]
+        async_url = async_url.difference_update_query(["sslmode"])
+    async_engine = create_async_engine(async_url, connect_args=async_connect_args, poolclass=InstrumentedAsyncQueuePool, **pool_options)
+
+def _pool_stats(pool, counters_key: str) -> Dict[str, Any]:
+    counters = _pool_counters[counters_key]
+    with _pool_lock:
+        checkouts = counters["checkouts"]
+        return {
+            "size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": checkouts,
+            "timeouts": counters["timeouts"],
+            "avg_wait_ms": round(counters["wait_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+            "max_wait_ms": round(counters["wait_max"] * 1000, 3),
+        }
+
+metrics.register("db_pool", lambda: _pool_stats(engine.pool, "sync"))
+metrics.register("db_pool_async", lambda: _pool_stats(async_engine.pool, "async"))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: handlers read attributes after commit, which would otherwise need an implicit (sync) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency for route handlers: one AsyncSession per request"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Native JSONB on Postgres, JSON-typed TEXT on SQLite; (de)serialized by SQLAlchemy/the driver
+JSONColumn = JSON().with_variant(JSONB(), "postgresql")
+
 # User model
 class User(Base):
     __tablename__ = "users"
@@ -48,10 +169,55 @@ class Analysis(Base):
     image_path = Column(String, nullable=True)  # Optional: store image path
     notes = Column(Text, nullable=True)  # Optional: user notes
     created_at = Column(DateTime, default=datetime.utcnow)
-    detection_summary = Column(Text, nullable=True)  # JSON string
+    detection_summary = Column(JSONColumn, nullable=True)  # {class_name: count}
     feedback = Column(Text, nullable=True)
-    recommendations = Column(Text, nullable=True)
-    secondary_summary = Column(Text, nullable=True)
+    recommendations = Column(JSONColumn, nullable=True)  # [str]
+    secondary_summary = Column(JSONColumn, nullable=True)  # {class_name: count}
     
     # Relationship to user
     user = relationship("User", back_populates="analyses")
+
+# Backs keyset pagination of a user's history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+analyses_history_index = Index(
+    "ix_analyses_user_created_id",
+    Analysis.user_id,
+    Analysis.created_at.desc(),
+    Analysis.id.desc()
+)
+
+class InferenceCacheEntry(Base):
+    """Shared tier of the detector result cache (see services/inference_cache.py)"""
+    __tablename__ = "inference_cache"
+    
+    cache_key = Column(String(64), primary_key=True)
+    model_id = Column(String)
+    result = Column(Text)  # JSON-encoded detector response
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+JSON_COLUMNS = ("detection_summary", "recommendations", "secondary_summary")
+
+def migrate_json_columns():
+    """
+    Convert the old TEXT-holding-JSON columns on analyses to JSONB (Postgres only).
+    SQLite stores the JSON type as TEXT in the same format, so existing rows
+    there already read back as dicts/lists and need no rewrite.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    
+    columns = {col["name"]: col["type"] for col in inspect(engine).get_columns("analyses")}
+    with engine.begin() as conn:
+        for name in JSON_COLUMNS:
+            if name in columns and not isinstance(columns[name], (JSON, JSONB)):
+                print(f"🛠️ Migrating analyses.{name} to JSONB")
+                conn.execute(text(
+                    f"ALTER TABLE analyses ALTER COLUMN {name} TYPE JSONB "
+                    f"USING NULLIF({name}, '')::jsonb"
+                ))
+
+def run_migrations():
+    """Idempotent schema changes that create_all() won't apply to existing tables"""
+    # create_all() only creates indexes together with new tables
+    analyses_history_index.create(bind=engine, checkfirst=True)
+    migrate_json_columns()
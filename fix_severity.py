@@ -1,32 +1,82 @@
-from database import SessionLocal, Analysis
+"""
+Recompute Analysis.severity from Analysis.score.
 
-def determine_severity_from_score(score: int) -> str:
-    if score >= 85:
-        return "clear"
-    elif score >= 70:
-        return "mild"
-    elif score >= 50:
-        return "moderate"
-    else:
-        return "severe"
+    python fix_severity.py                 # stream rows in id chunks, fix in Python
+    python fix_severity.py --mode sql      # one set-based UPDATE ... CASE per id chunk
+    python fix_severity.py --dry-run       # only report what would change
 
-db = SessionLocal()
+Runs are resumable: an interrupted run continues after the last committed
+chunk (see --checkpoint / --restart).
+"""
+import argparse
+from sqlalchemy import select, update, case, and_, bindparam, func
+from sqlalchemy.orm import Session
+from database import SessionLocal, Analysis
+from routers.analysis import determine_severity_from_score, SEVERITY_THRESHOLDS, SEVERITY_FLOOR
+from services.backfill import run_backfill
 
-# Get all analyses
-analyses = db.query(Analysis).all()
+def severity_case():
+    """SQL twin of determine_severity_from_score, built from the same thresholds"""
+    return case(
+        *[(Analysis.score >= minimum, severity) for minimum, severity in SEVERITY_THRESHOLDS],
+        else_=SEVERITY_FLOOR,
+    )
 
-print(f"Found {len(analyses)} analyses to check")
+def in_range(low_id: int, high_id: int):
+    return and_(Analysis.id > low_id, Analysis.id <= high_id, Analysis.score.isnot(None))
 
-for analysis in analyses:
-    old_severity = analysis.severity
-    correct_severity = determine_severity_from_score(analysis.score)
+def fix_chunk_python(db: Session, low_id: int, high_id: int, dry_run: bool) -> int:
+    rows = db.execute(
+        select(Analysis.id, Analysis.score, Analysis.severity).where(in_range(low_id, high_id))
+    ).all()
+    
+    fixes = []
+    for analysis_id, score, old_severity in rows:
+        correct_severity = determine_severity_from_score(score)
+        if old_severity != correct_severity:
+            print(f"Fixing Analysis {analysis_id}: score={score}, {old_severity} → {correct_severity}")
+            fixes.append({"row_id": analysis_id, "new_severity": correct_severity})
     
-    if old_severity != correct_severity:
-        print(f"Fixing Analysis {analysis.id}: score={analysis.score}, {old_severity} → {correct_severity}")
-        analysis.severity = correct_severity
+    if fixes and not dry_run:
+        stmt = update(Analysis.__table__).where(Analysis.id == bindparam("row_id")).values(severity=bindparam("new_severity"))
+        db.execute(stmt, fixes)
+    return len(fixes)
 
-# Save changes
-db.commit()
-print("✅ All severities updated!")
+def fix_chunk_sql(db: Session, low_id: int, high_id: int, dry_run: bool) -> int:
+    stale = and_(in_range(low_id, high_id), Analysis.severity.is_distinct_from(severity_case()))
+    if dry_run:
+        return db.execute(select(func.count()).where(stale)).scalar()
+    return db.execute(
+        update(Analysis).where(stale).values(severity=severity_case()).execution_options(synchronize_session=False)
+    ).rowcount
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute analysis severities from their scores")
+    parser.add_argument("--mode", choices=("python", "sql"), default="python",
+                        help="python: stream rows and reuse determine_severity_from_score; sql: set-based UPDATE ... CASE")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="ids per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default .backfill_fix_severity.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+    
+    apply = fix_chunk_sql if args.mode == "sql" else fix_chunk_python
+    db = SessionLocal()
+    try:
+        changed = run_backfill(
+            db, "fix_severity", Analysis.id, apply,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            checkpoint_path=args.checkpoint,
+            restart=args.restart,
+        )
+    finally:
+        db.close()
+    
+    if args.dry_run:
+        print(f"🔍 {changed} severities would be updated")
+    else:
+        print(f"✅ All severities updated! ({changed} changed)")
 
-db.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,27 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env")
 
 import os
-from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
-from database import SessionLocal, User, Analysis, Base, engine  # ADDED: Analysis
-from auth import hash_password, verify_password, create_access_token, get_current_user
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, Base, engine, async_engine, run_migrations
+from auth import create_access_token, get_current_user, Principal
+from crud import (
+    get_user_by_username_async, get_user_by_email_async, create_user_async, update_password_hash_async,
+    list_analyses_page_async, count_analyses_async
+)
+from services.passwords import hash_password_async, verify_and_update_async, password_pool
+from services.rate_limit import login_user_limiter, login_ip_limiter, client_ip
+from services.write_behind import analysis_writer
+from services.jobs import analysis_jobs
+from services.detectors import load_detectors
+from services import metrics
+from services.http_client import close_clients
+from services.uploads import UploadSizeLimitMiddleware, MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES
+from services.annotation_store import variant_urls, start_sweeper, stop_sweeper
+from services.http_cache import cached_json
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import json
-
-from database import Base, engine
 
 
 class UserRegister(BaseModel):
@@ -26,13 +36,6 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 print("ROBOFLOW_API_KEY loaded?", bool(os.getenv("ROBOFLOW_API_KEY")))
 
 app = FastAPI()
@@ -41,15 +44,43 @@ app = FastAPI()
 def startup():
     print("DB URL:", str(engine.url))
     Base.metadata.create_all(bind=engine)
+    run_migrations()
     print("✅ Tables ensured")
+    load_detectors()
 
+@app.on_event("startup")
+async def start_background_workers():
+    analysis_writer.start()
+    analysis_jobs.start()
+    start_sweeper()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Finish background jobs first (they queue history rows), then drain the
+    # queued rows while the DB engine is still up
+    await analysis_jobs.stop()
+    await analysis_writer.stop()
+    await stop_sweeper()
+    await close_clients()
+    password_pool.shutdown()
+    await async_engine.dispose()
+
+
+from routers import analysis, history, annotations, jobs
+from routers.history import pagination_params, current_user_id
 
-from routers import analysis, history
-
-os.makedirs("annotated", exist_ok=True)
-app.mount("/annotated", StaticFiles(directory="annotated"), name="annotated")
 app.include_router(analysis.router)
 app.include_router(history.router)
+app.include_router(annotations.router)
+app.include_router(jobs.router)
+
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/analyze",))
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=("/api/analyze/batch",),
+    max_body=analysis.ANALYZE_BATCH_MAX_FILES * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    detail=f"Batch is too large (max {analysis.ANALYZE_BATCH_MAX_FILES} images of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,49 +98,78 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+def get_metrics():
+    """Worker pool queue depth / wait time and other runtime counters"""
+    return metrics.snapshot()
+
 @app.post("/register")
-async def register(user: UserRegister, db: Session = Depends(get_db)):
+async def register(user: UserRegister, db: AsyncSession = Depends(get_async_db)):
     # Check if username exists
-    if db.query(User).filter(User.username == user.username).first():
+    if await get_user_by_username_async(db, user.username):
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Check if email exists
-    if db.query(User).filter(User.email == user.email).first():
+    if await get_user_by_email_async(db, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash the password
     try:
-        hashed_pwd = hash_password(user.password)
+        hashed_pwd = await hash_password_async(user.password)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
     # Create new user
-    new_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_pwd
-    )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await create_user_async(db, user.username, user.email, hashed_pwd)
     
     return {"message": "User registered successfully", "username": user.username}
 
 @app.post("/login")
-async def login(user: UserLogin, db: Session = Depends(get_db)):
+async def login(user: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # Throttle repeated failures per username and per client before doing any bcrypt work.
+    # Without a trustworthy client IP only the per-username limit applies: a shared
+    # fallback key would let anyone lock everyone out.
+    user_key = user.username.lower()
+    ip_key = client_ip(request)
+    retry_after = login_user_limiter.retry_after(user_key)
+    if ip_key is not None:
+        retry_after = max(retry_after, login_ip_limiter.retry_after(ip_key))
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, please try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
+    
     # Find user
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await get_user_by_username_async(db, user.username)
+    
+    # Verify password (bcrypt runs in the password process pool)
+    valid, new_hash = (False, None)
+    if db_user:
+        valid, new_hash = await verify_and_update_async(user.password, db_user.hashed_password)
     
-    # Verify password
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+    if not valid:
+        login_user_limiter.record_failure(user_key)
+        if ip_key is not None:
+            login_ip_limiter.record_failure(ip_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    login_user_limiter.reset(user_key)
+    
+    # Stored hash predates the current bcrypt cost: upgrade it now that we have the plaintext
+    if new_hash:
+        try:
+            await update_password_hash_async(db, db_user.id, new_hash)
+            print(f"🔐 Re-hashed password for user: {db_user.username}")
+        except Exception as e:
+            print(f"⚠️ Failed to update password hash: {str(e)}")
+    
     # Create token
-    access_token = create_access_token(data={"sub": db_user.username})
+    access_token = create_access_token(data={"sub": db_user.username}, user_id=db_user.id)
     
     # Return token
     return {
@@ -120,23 +180,23 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
 
 @app.get("/history")
 async def get_analysis_history(
-    current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    page: tuple = Depends(pagination_params),
+    principal: Principal = Depends(get_current_user),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all analysis history for the logged-in user.
-    Returns analyses sorted by date (newest first).
+    Get analysis history for the logged-in user, one page at a time.
+    Returns analyses sorted by date (newest first); pass `next_cursor`
+    back as ?cursor= to fetch the following page.
     """
-    # Get user
-    user = db.query(User).filter(User.username == current_user).first()
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Get one page of analyses for this user, sorted by date
+    limit, cursor = page
+    analyses, next_cursor = await list_analyses_page_async(db, user_id, limit, cursor)
     
-    # Get all analyses for this user, sorted by date
-    analyses = db.query(Analysis).filter(
-        Analysis.user_id == user.id
-    ).order_by(Analysis.created_at.desc()).all()
+    # Total is only counted on the first page (a single indexed COUNT)
+    total_analyses = await count_analyses_async(db, user_id) if cursor is None else None
     
     # Format results
     history = []
@@ -149,16 +209,18 @@ async def get_analysis_history(
             "date": analysis.created_at.isoformat(),
             "notes": analysis.notes,
             "image_path": analysis.image_path,
-            "detection_summary": json.loads(analysis.detection_summary) if analysis.detection_summary else {},
+            "image_variants": variant_urls(analysis.image_path),
+            "detection_summary": analysis.detection_summary or {},
             "feedback": analysis.feedback,
-            "recommendations": json.loads(analysis.recommendations) if analysis.recommendations else []
+            "recommendations": analysis.recommendations or []
         })
     
-    return {
-        "username": current_user,
-        "total_analyses": len(history),
-        "history": history
-    }
+    return cached_json(request, {
+        "username": principal.username,
+        "total_analyses": total_analyses,
+        "history": history,
+        "next_cursor": next_cursor
+    })
 # ============================================================================
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from datetime import datetime
 
 class AcneDetection(BaseModel):
@@ -27,6 +27,33 @@ class AnalysisResponse(BaseModel):
     secondary_score: Optional[int] = None
     combined_score: Optional[int] = None
 
+class BatchAggregate(BaseModel):
+    image_count: int
+    acne_count: int
+    skin_score: int
+    average_confidence: float
+    detection_summary: Dict[str, int]
+    feedback: str
+    severity: str
+    recommendations: List[str]
+    secondary_summary: Optional[Dict[str, int]] = None
+    secondary_score: Optional[int] = None
+    combined_score: Optional[int] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[AnalysisResponse]
+    aggregate: BatchAggregate
+    timestamp: datetime
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    events: List[Dict[str, Any]] = []
+    result: Optional[AnalysisResponse] = None
+    error: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
 class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat()
@@ -1,38 +1,43 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from pathlib import Path
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Header, Request, Response
+from fastapi.responses import JSONResponse
+import os
+import asyncio
+from contextlib import nullcontext
 from datetime import datetime
-from model.schemas import AnalysisResponse, AcneDetection
-from services.roboflow import analyze_image, analyze_secondary
+from model.schemas import AnalysisResponse, AcneDetection, BatchAnalysisResponse, BatchAggregate
+from services.detectors import analyze_both
+from services.box_fusion import fuse_predictions
+from services import scoring
+from services.feedback import evaluate_feedback
 from PIL import Image
 import pillow_heif
-from services.image_processor import draw_detections
-from sqlalchemy.orm import Session
-from database import SessionLocal, User, Analysis
-from auth import get_current_user_optional
-from typing import Optional
-import json
-
-ANNOTATED_DIR = Path("annotated")
-ANNOTATED_DIR.mkdir(exist_ok=True)
+from services.image_processor import decode_image, prepare_for_inference, rescale_result, ImageTooLargeError, ANNOTATED_SUFFIX
+from services.uploads import read_upload
+from services.annotation_store import save_pending
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, AsyncSessionLocal
+from auth import get_current_user_optional, Principal
+from crud import get_user_id_by_username_async
+from services.write_behind import analysis_writer
+from services.jobs import analysis_jobs, Job
+from services.single_flight import analysis_flights
+from services.executor import run_cpu
+from services.rate_limit import client_ip
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+from uuid import uuid4
 
 pillow_heif.register_heif_opener()
 
 router = APIRouter(prefix= "/api", tags= ["analysis"])
 
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# /api/analyze/batch: images per request, and how many of them may be waiting
+# on the detectors at once (decode/preprocess is already bounded by the CPU pool)
+ANALYZE_BATCH_MAX_FILES = int(os.getenv("ANALYZE_BATCH_MAX_FILES", "6"))
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "2"))
 
 # Classes to exclude from detection
 EXCLUDED_CLASSES = {'freckles', 'freckle', 'Freckles', 'Freckle'}
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def generate_feedback(acne_count: int, avg_confidence: float):
     if acne_count == 0:
         severity = "clear"
@@ -74,295 +79,83 @@ def generate_feedback(acne_count: int, avg_confidence: float):
     return severity, feedback, recommendations
 
 def calculate_skin_score_multi(detection_summary: dict, avg_confidence: float) -> int:
-    base_score = 95
-    total_penalty = 0
-    
-    severity_weights = {
-        'cystic': 8,
-        'purulent': 7,
-        'Acne': 6,
-        'conglobata': 8,
-        'Pimples': 5,
-        'papular': 5,
-        'whitehead': 4,
-        'blackhead': 4,
-        'acne_scars': 4,
-        'keloid': 5,
-        'folliculitis': 3,
-        'milium': 2,
-        'crystalline': 2,
-        'flat_wart': 3,
-        'syringoma': 2,
-        'sebo-crystan-conglo': 5,
-    }
-    
-    for condition_type, count in detection_summary.items():
-        weight = severity_weights.get(condition_type, 4)
-        
-        if count <= 2:
-            penalty = count * weight
-        elif count <= 5:
-            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
-        elif count <= 10:
-            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
-        else:
-            penalty = (2 * weight) + (3 * weight * 1.2) + (5 * weight) + ((count - 10) * (weight * 0.8))
-        
-        total_penalty += penalty
-    
-    total_penalty = min(total_penalty, 70)
-    final_score = base_score - total_penalty
-    return max(30, min(95, int(final_score)))
+    return scoring.skin_score(detection_summary)
 
 def calculate_secondary_score(detection_summary: dict, avg_confidence: float) -> int:
     """Calculate score for secondary skin conditions (melasma, rosacea)"""
-    base_score = 95
-    total_penalty = 0
-    
-    secondary_weights = {
-        'acne': 6,
-        'Acne': 6,
-        'melasma': 7,
-        'Melasma': 7,
-        'rosacea': 8,
-        'Rosacea': 8,
-    }
-    
-    for condition_type, count in detection_summary.items():
-        weight = secondary_weights.get(condition_type, 5)
-        
-        if count <= 2:
-            penalty = count * weight
-        elif count <= 5:
-            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
-        else:
-            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
-        
-        total_penalty += penalty
-    
-    total_penalty = min(total_penalty, 70)
-    final_score = base_score - total_penalty
-    
-    print(f"🔢 Secondary score calculation: base={base_score}, penalty={total_penalty}, final={final_score}")
-    
-    return max(30, min(95, int(final_score)))
+    return scoring.secondary_score(detection_summary)
 
-def combine_scores(primary_score: int, primary_summary: dict, secondary_score: int, secondary_summary: dict) -> int:
+def combine_scores(primary_score: int, primary_summary: dict, secondary_score: int, secondary_summary: dict, fused: bool = False) -> int:
     """
     Smart merge: Only apply penalties for conditions that the primary model didn't detect
     This prevents double-penalization when both models detect the same issues
+    fused=True: secondary_summary only counts boxes that box fusion found no primary
+    match for, so those are penalized even when the primary model also found acne
     """
-    combined = primary_score
-    
-    secondary_weights = {
-        'acne': 6,
-        'Acne': 6,
-        'melasma': 7,
-        'Melasma': 7,
-        'rosacea': 8,
-        'Rosacea': 8,
-    }
-    
-    has_primary_acne = any(
-        key in primary_summary 
-        for key in ['Acne', 'Pimples', 'papular', 'cystic', 'purulent', 'conglobata']
-    )
-    
-    additional_penalty = 0
-    unique_conditions = []
-    
-    print(f"🔍 Smart merge analysis:")
-    print(f"   Primary detected acne: {has_primary_acne}")
-    print(f"   Primary summary: {primary_summary}")
-    print(f"   Secondary summary: {secondary_summary}")
-    
-    for condition_type, count in secondary_summary.items():
-        condition_lower = condition_type.lower()
-        is_acne_condition = condition_lower in ['acne'] or condition_type in ['Acne']
-        
-        if is_acne_condition and has_primary_acne:
-            print(f"   ⏭️  Skipping {condition_type} (already detected by primary)")
-            continue
-        
-        weight = secondary_weights.get(condition_type, 5)
-        
-        if count <= 2:
-            penalty = count * weight
-        elif count <= 5:
-            penalty = (2 * weight) + ((count - 2) * (weight * 1.2))
-        else:
-            penalty = (2 * weight) + (3 * weight * 1.2) + ((count - 5) * (weight * 1.0))
-        
-        additional_penalty += penalty
-        unique_conditions.append(f"{count}x {condition_type}")
-        print(f"   ➕ Adding penalty for {condition_type}: {penalty} (unique condition)")
-    
-    combined = primary_score - int(additional_penalty)
-    combined = max(30, min(95, combined))
-    
-    print(f"🔢 Smart merge result:")
-    print(f"   Primary score: {primary_score}")
-    print(f"   Unique secondary conditions: {', '.join(unique_conditions) if unique_conditions else 'None'}")
-    print(f"   Additional penalty: {int(additional_penalty)}")
-    print(f"   Combined score: {combined}")
-    
-    return combined
+    return scoring.combined_score(primary_score, primary_summary, secondary_summary, fused)
 
 def generate_feedback_multi(detection_summary: dict, avg_confidence: float):
-    total_concerns = sum(detection_summary.values())
-    
-    if total_concerns == 0:
-        return "clear", "Great news! No skin concerns detected. Your skin looks healthy!", [
-            "Maintain your current skincare routine",
-            "Continue using sunscreen daily (SPF 30+)",
-            "Stay hydrated and get adequate sleep",
-            "Cleanse gently twice daily"
-        ]
-    
-    concerns = []
-    for condition_type, count in detection_summary.items():
-        readable_name = condition_type.replace('_', ' ').title()
-        concerns.append(f"{count} {readable_name}")
-    
-    concern_text = ", ".join(concerns)
-    feedback = f"Analysis detected: {concern_text}."
-    
-    recommendations = []
-    seen_recommendations = set()
-    
-    if any(key in detection_summary for key in ['cystic', 'purulent', 'Acne', 'conglobata', 'Pimples']):
-        recs = [
-            "Use a gentle cleanser with salicylic acid (2%) or benzoyl peroxide (2.5-5%)",
-            "Apply spot treatment to active breakouts",
-            "Avoid touching or picking at your face",
-            "Change pillowcases regularly"
-        ]
-        for rec in recs:
-            if rec not in seen_recommendations:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if any(key in detection_summary for key in ['cystic', 'purulent', 'conglobata']):
-        if detection_summary.get('cystic', 0) + detection_summary.get('purulent', 0) > 3:
-            rec = "Consider consulting a dermatologist for prescription treatments (this may require professional care)"
-            if rec not in seen_recommendations:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if 'blackhead' in detection_summary:
-        recs = [
-            "Use a BHA (salicylic acid) exfoliant 2-3 times per week",
-            "Try oil cleansing to help dissolve sebum",
-            "Consider professional extractions for stubborn blackheads"
-        ]
-        for rec in recs:
-            if rec not in seen_recommendations:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if 'whitehead' in detection_summary:
-        recs = [
-            "Use products with salicylic acid to unclog pores",
-            "Avoid heavy, pore-clogging moisturizers",
-            "Don't squeeze whiteheads - let them heal naturally"
-        ]
-        for rec in recs:
-            if rec not in seen_recommendations:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if 'acne_scars' in detection_summary:
-        recs = [
-            "Apply vitamin C serum to help fade scarring",
-            "Use products with niacinamide for skin repair",
-            "Always wear SPF 30+ to prevent darkening of scars",
-            "Consider professional treatments (microneedling, laser) for severe scarring"
-        ]
-        for rec in recs:
-            if rec not in seen_recommendations:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if 'milium' in detection_summary:
-        rec = "Milia may require professional extraction - avoid trying to remove them yourself"
-        if rec not in seen_recommendations:
-            recommendations.append(rec)
-            seen_recommendations.add(rec)
-    
-    if len(recommendations) < 3:
-        general_recs = [
-            "Maintain a consistent skincare routine",
-            "Avoid harsh scrubbing or over-exfoliation",
-            "Keep hair and hands away from your face"
-        ]
-        for rec in general_recs:
-            if rec not in seen_recommendations and len(recommendations) < 5:
-                recommendations.append(rec)
-                seen_recommendations.add(rec)
-    
-    if total_concerns == 0:
-        severity = "clear"
-    elif total_concerns <= 5:
-        severity = "mild"
-    elif total_concerns <= 15:
-        severity = "moderate"
-    else:
-        severity = "severe"
+    """Severity, feedback text and recommendations from the feedback rules (services.feedback)"""
+    return evaluate_feedback(detection_summary)
 
-    return severity, feedback, recommendations
+# (minimum score, severity), highest first; anything below the last is SEVERITY_FLOOR.
+# fix_severity.py builds its SQL CASE from the same table.
+SEVERITY_THRESHOLDS = ((85, "clear"), (70, "mild"), (50, "moderate"))
+SEVERITY_FLOOR = "severe"
 
 def determine_severity_from_score(score: int) -> str:
     """Determine severity based on skin health score"""
-    if score >= 85:
-        return "clear"
-    elif score >= 70:
-        return "mild"
-    elif score >= 50:
-        return "moderate"
-    else:
-        return "severe"
+    for minimum, severity in SEVERITY_THRESHOLDS:
+        if score >= minimum:
+            return severity
+    return SEVERITY_FLOOR
 
-def convert_heic_to_jpg(heic_path: Path) -> Path:
+def load_image(upload) -> Image.Image:
+    """Decode the in-memory upload (HEIC included, via pillow_heif) into an upright RGB image"""
     try:
-        print(f"🔄 Converting HEIC to JPG: {heic_path}")
-        image = Image.open(heic_path)
-        jpg_path = heic_path.with_suffix('.jpg')
-        image.convert('RGB').save(jpg_path, 'JPEG', quality=95)
-        heic_path.unlink()
-        print(f"✅ Converted to: {jpg_path}")
-        return jpg_path
+        return decode_image(upload.open())
+    except ImageTooLargeError as e:
+        print(f"❌ Image rejected: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        print(f"❌ HEIC conversion failed: {str(e)}")
-        raise HTTPException(status_code=400, detail="Failed to process HEIC image")
+        print(f"❌ Image decoding failed: {str(e)}")
+        raise HTTPException(status_code=400, detail="Failed to process image")
 
-@router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_face(
-    file: UploadFile = File(...),
-    current_user: Optional[str] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
-):
-    allowed_types = ["image/jpeg", "image/png", "image/heic", "image/heif", "image/webp"]
-    if file.content_type not in allowed_types and not file.filename.lower().endswith(('.heic', '.heif')):
-        raise HTTPException(status_code=400, detail="File must be an image (JPG, PNG, HEIC, WebP)")
-    
-    file_path = UPLOAD_DIR / f"{datetime.now().timestamp()}_{file.filename}"
-    
+def _no_progress(stage: str, **data):
+    pass
+
+async def run_pipeline(
+    upload,
+    detector_slots: Optional[asyncio.Semaphore] = None,
+    progress: Callable[..., None] = _no_progress,
+    keep_annotation: bool = False,
+) -> Tuple[AnalysisResponse, Dict[str, Any]]:
+    """
+    Decode -> preprocess -> both detectors -> score -> defer annotation for one upload.
+    Returns the response plus the history row for it (without user_id).
+    `detector_slots` bounds how many uploads are at the detector stage at once;
+    `progress(stage, **data)` is told when each model returns and when the annotation is ready.
+    `keep_annotation`: the row goes to history, so the annotated image must never expire.
+    """
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as buffer:
-            buffer.write(contents)
+        # Decode once; every stage below shares this image
+        image = await run_cpu(load_image, upload)
         
-        print(f"📁 File saved to: {file_path}")
+        # Downscale + re-encode; both models share this payload
+        inference_bytes, scale = await run_cpu(prepare_for_inference, image)
         
-        if file.filename.lower().endswith(('.heic', '.heif')):
-            file_path = convert_heic_to_jpg(file_path)
-        
-        # PRIMARY ANALYSIS
+        # PRIMARY + SECONDARY ANALYSIS (run concurrently)
         print(f"=" * 60)
-        print(f"🔬 STARTING PRIMARY ANALYSIS")
+        print(f"🔬 STARTING PRIMARY + SECONDARY ANALYSIS")
         print(f"=" * 60)
         
-        roboflow_result = analyze_image(str(file_path))
+        async with detector_slots or nullcontext():
+            roboflow_result, secondary_result, secondary_error = await analyze_both(
+                inference_bytes, on_done=lambda model: progress(f"{model}_done")
+            )
+        roboflow_result = rescale_result(roboflow_result, scale)
+        if secondary_result is not None:
+            secondary_result = rescale_result(secondary_result, scale)
         
         filtered_predictions = [
             pred for pred in roboflow_result.get("predictions", [])
@@ -371,6 +164,13 @@ async def analyze_face(
         
         print(f"🔍 Filtered out {len(roboflow_result.get('predictions', [])) - len(filtered_predictions)} freckle detections")
         
+        # Geometry-based cross-model dedup: secondary boxes on top of an equivalent
+        # primary detection are fused into it; scoring and the annotation use the fused set
+        secondary_predictions = secondary_result.get("predictions", []) if secondary_result is not None else []
+        filtered_predictions, secondary_predictions, fused_count = fuse_predictions(filtered_predictions, secondary_predictions)
+        if fused_count:
+            print(f"🔗 Fused {fused_count} secondary detection(s) into primary ones")
+        
         detections = []
         total_confidence = 0
         detection_summary = {}
@@ -420,10 +220,10 @@ async def analyze_face(
         secondary_triggered = True
         
         try:
-            secondary_result = analyze_secondary(str(file_path))
-            secondary_predictions = secondary_result.get("predictions", [])
+            if secondary_error is not None:
+                raise secondary_error
             
-            print(f"🔍 Secondary model returned {len(secondary_predictions)} predictions")
+            print(f"🔍 Secondary model: {len(secondary_predictions)} predictions after fusion")
             
             secondary_detections = []
             secondary_summary = {}
@@ -457,10 +257,10 @@ async def analyze_face(
             )
             
             secondary_score = calculate_secondary_score(secondary_summary, secondary_avg_confidence)
-            combined_score = combine_scores(skin_score, detection_summary, secondary_score, secondary_summary)
+            combined_score = combine_scores(skin_score, detection_summary, secondary_score, secondary_summary, fused=True)
             
             print(f"📊 Secondary analysis - Conditions: {len(secondary_predictions)}, Score: {secondary_score}/100")
-            print(f"🎯 Combined score: {combined_score}/100")
+            print(f"🎯 Combined score: {combined_score}/100 (primary {skin_score})")
             print(f"=" * 60)
             
             # Update feedback if secondary found issues
@@ -483,22 +283,19 @@ async def analyze_face(
                         feedback = f"{feedback[:-1]}. Additional analysis detected: {secondary_concerns}."
                     else:
                         feedback = f"{feedback} Additional analysis detected: {secondary_concerns}."
-                        
+        
         except Exception as e:
             print(f"⚠️ Secondary analysis failed: {str(e)}")
             print(f"=" * 60)
         
-        annotated_filename = f"annotated_{datetime.now().timestamp()}{file_path.suffix}"
-        annotated_path = ANNOTATED_DIR / annotated_filename
+        annotation_id = f"annotated_{datetime.now().timestamp()}_{uuid4().hex[:8]}"
+        annotated_filename = f"{annotation_id}{ANNOTATED_SUFFIX}"
         
-        draw_detections(
-            str(file_path), 
-            all_detections_for_image, 
-            str(annotated_path),
-            model_sources=model_sources
-        )
+        # Rendering is deferred until the annotated URL is first requested
+        await save_pending(annotation_id, ANNOTATED_SUFFIX, image, all_detections_for_image, model_sources, keep=keep_annotation)
         
-        print(f"📸 Annotated image saved: {annotated_path}")
+        print(f"📸 Annotated image deferred: /annotated/{annotated_filename}")
+        progress("annotated", annotated_image_url=f"/annotated/{annotated_filename}")
         
         # CHANGED: Calculate final score AND final severity based on combined score
         final_score_for_db = combined_score if combined_score is not None else skin_score
@@ -506,32 +303,19 @@ async def analyze_face(
         print(f"💾 Final score for database: {final_score_for_db}")
         print(f"💾 Final severity for database: {final_severity}")
         
-        if current_user:
-            try:
-                user = db.query(User).filter(User.username == current_user).first()
-                if user:
-                    new_analysis = Analysis(
-                        user_id=user.id,
-                        acne_count=total_concerns,
-                        severity=final_severity,  # CHANGED: Use final_severity based on combined score
-                        score=final_score_for_db,
-                        image_path=f"/annotated/{annotated_filename}",
-                        created_at=datetime.now(),
-                        detection_summary=json.dumps(detection_summary),
-                        secondary_summary= json.dumps(secondary_summary) if secondary_summary else None,
-                        feedback=feedback,
-                        recommendations=json.dumps(recommendations),
-                    )
-                    db.add(new_analysis)
-                    db.commit()
-                    db.refresh(new_analysis)
-                    print(f"💾 Analysis saved to history for user: {current_user}")
-            except Exception as e:
-                print(f"⚠️ Failed to save analysis to database: {str(e)}")
-        else:
-            print(f"👤 Anonymous user - analysis not saved to history")
+        record = dict(
+            acne_count=total_concerns,
+            severity=final_severity,  # CHANGED: Use final_severity based on combined score
+            score=final_score_for_db,
+            image_path=f"/annotated/{annotated_filename}",
+            created_at=datetime.now(),
+            detection_summary=detection_summary,
+            secondary_summary=secondary_summary if secondary_summary else None,
+            feedback=feedback,
+            recommendations=recommendations,
+        )
         
-        return AnalysisResponse(
+        response = AnalysisResponse(
             acne_count=total_concerns,
             skin_score=skin_score,
             average_confidence=avg_confidence,
@@ -548,12 +332,201 @@ async def analyze_face(
             secondary_score=secondary_score,
             combined_score=combined_score
         )
+        return response, record
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
         print(f"❌ Error during analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+async def save_history(current_user: Optional[Principal], db: AsyncSession, records: List[Dict[str, Any]]):
+    """Queue history rows for the caller, committed together; anonymous results aren't saved"""
+    if current_user:
+        try:
+            user_id = current_user.user_id
+            if user_id is None:
+                user_id = await get_user_id_by_username_async(db, current_user.username)
+            if user_id is not None:
+                # Written by the background writer after the response goes out
+                analysis_writer.enqueue_group([dict(record, user_id=user_id) for record in records])
+                print(f"💾 Analysis queued for history for user: {current_user.username}")
+        except Exception as e:
+            print(f"⚠️ Failed to queue analysis for database: {str(e)}")
+    else:
+        print(f"👤 Anonymous user - analysis not saved to history")
+
+async def analyze_and_save(upload, current_user: Optional[Principal], progress: Callable[..., None] = _no_progress) -> AnalysisResponse:
+    """Pipeline + history row for one upload; closes the upload"""
+    try:
+        response, record = await run_pipeline(upload, progress=progress, keep_annotation=current_user is not None)
+    finally:
+        upload.close()
+    
+    # Own session: this can outlive the request that started it (jobs, de-duplicated calls)
+    async with AsyncSessionLocal() as db:
+        await save_history(current_user, db, [record])
+    progress("saved", saved=current_user is not None)
+    return response
+
+async def dedup_key(upload, current_user: Optional[Principal], request: Request, idempotency_key: Optional[str]) -> Tuple[tuple, Optional[str]]:
+    """
+    Single-flight key for an analyze call: the caller plus either their
+    Idempotency-Key (fingerprinted by the image hash) or the image hash itself.
+    """
+    caller = current_user.username if current_user else f"anon:{client_ip(request) or 'unknown'}"
+    content_hash = await run_cpu(upload.sha256)
+    if idempotency_key:
+        return (caller, "key", idempotency_key), content_hash
+    return (caller, "image", content_hash), None
+
+async def run_analysis_job(job: Job, upload, current_user: Optional[Principal], key: tuple, fingerprint: Optional[str]) -> AnalysisResponse:
+    """Background twin of analyze_face: same pipeline, progress goes to the job"""
+    response, shared = await analysis_flights.run(
+        key, lambda: analyze_and_save(upload, current_user, job.progress), fingerprint, discard=upload.close
+    )
+    if shared:
+        job.progress("deduplicated")
+    return response
+
+def submit_analysis_job(upload, current_user: Optional[Principal], key: tuple, fingerprint: Optional[str]) -> JSONResponse:
+    try:
+        job = analysis_jobs.submit(
+            lambda job: run_analysis_job(job, upload, current_user, key, fingerprint),
+            owner=current_user.username if current_user else None,
+            discard=upload.close,
+        )
+    except HTTPException:
+        upload.close()
+        raise
+    job.progress("uploaded", size=upload.size, format=upload.format)
+    print(f"🧾 Analysis job queued: {job.id}")
+    
+    status_url = f"/api/jobs/{job.id}"
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": status_url, "events_url": f"{status_url}/events"},
+        headers={"Location": status_url}
+    )
+
+@router.post("/analyze", response_model=AnalysisResponse)
+async def analyze_face(
+    request: Request,
+    http_response: Response,
+    file: UploadFile = File(...),
+    mode: Literal["sync", "job"] = Query("sync"),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: Optional[Principal] = Depends(get_current_user_optional)
+):
+    # Format comes from the file's magic bytes, not content_type/extension;
+    # oversized or non-image bodies are rejected while streaming
+    upload = await read_upload(file)
+    print(f"📁 Upload received: {upload.size // 1024} KB ({upload.format})")
     
+    # Double taps / retries of the same image (or Idempotency-Key) share one
+    # run and one history row; see services.single_flight
+    key, fingerprint = await dedup_key(upload, current_user, request, idempotency_key)
+    
+    # mode=job: answer 202 with a job id now; poll /api/jobs/{id} or follow its SSE events
+    if mode == "job":
+        return submit_analysis_job(upload, current_user, key, fingerprint)
+    
+    response, shared = await analysis_flights.run(
+        key, lambda: analyze_and_save(upload, current_user), fingerprint, discard=upload.close
+    )
+    if shared:
+        print(f"♻️ Duplicate analyze request served from the first one")
+        http_response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def aggregate_results(results: List[AnalysisResponse]) -> BatchAggregate:
+    """
+    One overall result for several photos of the same face: detections from
+    every image are pooled and scored the same way a single image is.
+    """
+    detection_summary = {}
+    secondary_summary = None
+    total_confidence = 0
+    secondary_total_confidence = 0
+    secondary_count = 0
+    
+    for result in results:
+        for class_name, count in result.detection_summary.items():
+            detection_summary[class_name] = detection_summary.get(class_name, 0) + count
+        total_confidence += result.average_confidence * result.acne_count
+        
+        # None means the secondary model failed for that image
+        if result.secondary_detections is not None:
+            secondary_summary = secondary_summary or {}
+            for detection in result.secondary_detections:
+                secondary_summary[detection.class_name] = secondary_summary.get(detection.class_name, 0) + 1
+                secondary_total_confidence += detection.confidence
+                secondary_count += 1
+    
+    acne_count = sum(result.acne_count for result in results)
+    avg_confidence = total_confidence / acne_count if acne_count > 0 else 0
+    skin_score = calculate_skin_score_multi(detection_summary, avg_confidence)
+    _, feedback, recommendations = generate_feedback_multi(detection_summary, avg_confidence)
+    
+    secondary_score = None
+    combined_score = None
+    if secondary_summary is not None:
+        secondary_avg_confidence = secondary_total_confidence / secondary_count if secondary_count else 0
+        secondary_score = calculate_secondary_score(secondary_summary, secondary_avg_confidence)
+        combined_score = combine_scores(skin_score, detection_summary, secondary_score, secondary_summary, fused=True)
+    
+    final_score = combined_score if combined_score is not None else skin_score
+    return BatchAggregate(
+        image_count=len(results),
+        acne_count=acne_count,
+        skin_score=skin_score,
+        average_confidence=avg_confidence,
+        detection_summary=detection_summary,
+        feedback=feedback,
+        severity=determine_severity_from_score(final_score),
+        recommendations=recommendations,
+        secondary_summary=secondary_summary,
+        secondary_score=secondary_score,
+        combined_score=combined_score
+    )
+
+@router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Analyze several photos (e.g. front/left/right) in one request and score them together"""
+    if len(files) > ANALYZE_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_FILES} images per batch")
+    
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await read_upload(file))
+        print(f"📁 Batch received: {len(uploads)} images, {sum(u.size for u in uploads) // 1024} KB")
+        
+        # Every image decodes/preprocesses in parallel; only detector calls are throttled
+        detector_slots = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+        outcomes = await asyncio.gather(
+            *(run_pipeline(upload, detector_slots, keep_annotation=current_user is not None) for upload in uploads),
+            return_exceptions=True
+        )
     finally:
-        if file_path.exists():
-            file_path.unlink()
-            print(f"🗑️ Cleaned up temporary file")
\ No newline at end of file
+        for upload in uploads:
+            upload.close()
+    
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, HTTPException):
+            raise HTTPException(status_code=outcome.status_code, detail=f"Image {index + 1}: {outcome.detail}")
+        if isinstance(outcome, BaseException):
+            raise outcome
+    
+    results = [response for response, _ in outcomes]
+    aggregate = aggregate_results(results)
+    print(f"🎯 Batch score: {aggregate.combined_score if aggregate.combined_score is not None else aggregate.skin_score}/100 over {aggregate.image_count} images")
+    
+    # All rows of a batch are committed in one transaction (or none are)
+    await save_history(current_user, db, [record for _, record in outcomes])
+    return BatchAnalysisResponse(results=results, aggregate=aggregate, timestamp=datetime.now())
@@ -0,0 +1,25 @@
+import os
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+from services.annotation_store import get_annotated
+from services.executor import run_io
+from services.http_cache import file_etag, is_not_modified, not_modified, IMMUTABLE_CACHE_CONTROL
+
+router = APIRouter(tags=["annotations"])
+
+@router.get("/annotated/{filename}")
+async def get_annotated_image(filename: str, request: Request):
+    """Serve an annotated image or one of its size variants, rendering on first request"""
+    if "/" in filename or "\\" in filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    path = await get_annotated(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    stat_result = await run_io(os.stat, path)
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": file_etag(stat_result)}
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    
+    return FileResponse(path, headers=headers, stat_result=stat_result)
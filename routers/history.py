@@ -1,31 +1,53 @@
-import json
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import SessionLocal, Analysis, User
-from auth import get_current_user
-from typing import List
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from auth import get_current_user, Principal
+from crud import get_user_id_by_username_async, list_analyses_page_async, decode_cursor, delete_analysis_async
+from services.annotation_store import variant_urls
+from services.http_cache import cached_json
+from typing import Optional, Tuple
 
 router = APIRouter(prefix="/api", tags=["history"])
 
-def get_db():
-    db = SessionLocal()
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+
+async def current_user_id(
+    principal: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> int:
+    """User id from the token; falls back to a cached username lookup for older tokens"""
+    if principal.user_id is not None:
+        return principal.user_id
+    user_id = await get_user_id_by_username_async(db, principal.username)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+def pagination_params(
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None)
+) -> Tuple[int, Optional[tuple]]:
+    """Shared ?limit=&cursor= handling for the history endpoints"""
     try:
-        yield db
-    finally:
-        db.close()
+        decoded = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return limit or HISTORY_PAGE_SIZE, decoded
 
 @router.get("/history")
 async def get_history(
-    current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    page: Tuple[int, Optional[tuple]] = Depends(pagination_params),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == current_user).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    limit, cursor = page
+    analyses, next_cursor = await list_analyses_page_async(db, user_id, limit, cursor)
     
-    analyses = db.query(Analysis).filter(Analysis.user_id == user.id).order_by(Analysis.created_at.desc()).all()
-    
-    return {
+    return cached_json(request, {
+        "next_cursor": next_cursor,
         "history": [
             {
                 "id": analysis.id,
@@ -34,38 +56,29 @@ async def get_history(
                 "severity": analysis.severity,
                 "date": analysis.created_at.isoformat(),
                 "image_path": analysis.image_path,
+                "image_variants": variant_urls(analysis.image_path),
                 "feedback": analysis.feedback,
-                "recommendations": json.loads(analysis.recommendations) if isinstance(analysis.recommendations, str) else analysis.recommendations,
-                "detection_summary": json.loads(analysis.detection_summary) if isinstance(analysis.detection_summary, str) else analysis.detection_summary,
-                # ADD THIS - return secondary_summary if it exists
-                "secondary_summary": json.loads(analysis.secondary_summary) if hasattr(analysis, 'secondary_summary') and isinstance(analysis.secondary_summary, str) else (analysis.secondary_summary if hasattr(analysis, 'secondary_summary') else {})
+                "recommendations": analysis.recommendations,
+                "detection_summary": analysis.detection_summary,
+                "secondary_summary": analysis.secondary_summary
             }
             for analysis in analyses
         ]
-    }
+    })
 
 @router.delete("/history/{analysis_id}")
 async def delete_analysis(
     analysis_id: int,
-    current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    principal: Principal = Depends(get_current_user),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a specific analysis by ID"""
-    user = db.query(User).filter(User.username == current_user).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    deleted = await delete_analysis_async(db, user_id, analysis_id)
     
-    analysis = db.query(Analysis).filter(
-        Analysis.id == analysis_id,
-        Analysis.user_id == user.id
-    ).first()
-    
-    if not analysis:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Analysis not found or you don't have permission to delete it")
     
-    db.delete(analysis)
-    db.commit()
-    
-    print(f"✅ Deleted analysis {analysis_id} for user {current_user}")
+    print(f"✅ Deleted analysis {analysis_id} for user {principal.username}")
     
     return {"message": "Analysis deleted successfully", "id": analysis_id}
\ No newline at end of file
@@ -0,0 +1,41 @@
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from auth import get_current_user_optional, Principal
+from model.schemas import JobStatus
+from services.jobs import analysis_jobs, Job
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+def get_job(job_id: str, current_user: Optional[Principal] = Depends(get_current_user_optional)) -> Job:
+    """The job, if it exists and the caller may see it (jobs of signed-in users are private)"""
+    job = analysis_jobs.get(job_id)
+    if job is None or (job.owner is not None and (current_user is None or current_user.username != job.owner)):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job: Job = Depends(get_job)):
+    return job.snapshot()
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(job: Job = Depends(get_job)):
+    """
+    Server-sent events: every progress event so far, then new ones as they
+    happen (uploaded, primary_done, secondary_done, annotated, saved), ending
+    with `done` (carrying the result) or `failed`.
+    """
+    async def stream():
+        async for event in job.follow():
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['stage']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from services.executor import run_cpu, run_io
+from services import metrics
+from PIL import Image
+from services.image_processor import (
+    decode_image, render_detections, resize_to_fit, encode_image,
+    ANNOTATION_MAX_SIDE, ANNOTATION_VARIANTS, SUFFIX_FORMATS, ANNOTATED_SUFFIX
+)
+
+# Annotated images are rendered lazily: /api/analyze only stores a source image
+# (the upload downscaled to ANNOTATION_MAX_SIDE, the size the render uses anyway)
+# and the detections here, and the image is drawn the first time its URL is
+# requested. A periodic sweep handles sources still pending after
+# ANNOTATION_SOURCE_TTL seconds: ones whose analysis went to history are
+# rendered (their URL is stored, so the image must outlive the source), the
+# rest (anonymous results) are deleted and their annotated URL then 404s.
+ANNOTATED_DIR = Path("annotated")
+ANNOTATION_SOURCE_DIR = Path(os.getenv("ANNOTATION_SOURCE_DIR", "annotation_sources"))
+ANNOTATION_SOURCE_TTL = float(os.getenv("ANNOTATION_SOURCE_TTL", str(24 * 3600)))
+ANNOTATION_SWEEP_INTERVAL = float(os.getenv("ANNOTATION_SWEEP_INTERVAL", "600"))
+ANNOTATION_SOURCE_QUALITY = 90
+
+ANNOTATED_DIR.mkdir(exist_ok=True)
+ANNOTATION_SOURCE_DIR.mkdir(exist_ok=True)
+
+# One render per annotation id + suffix, however many requests arrive before it's on disk
+_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+_sweeper: Optional[asyncio.Task] = None
+_counters = {"pending_saved": 0, "rendered": 0, "expired_files": 0, "expired_rendered": 0}
+
+metrics.register("annotation_store", lambda: dict(_counters))
+
+def _source_paths(annotation_id: str):
+    return ANNOTATION_SOURCE_DIR / f"{annotation_id}.src", ANNOTATION_SOURCE_DIR / f"{annotation_id}.json"
+
+def _write_pending(annotation_id: str, suffix: str, image: Image.Image, predictions: List[dict], model_sources: List[str], keep: bool):
+    source = resize_to_fit(image, ANNOTATION_MAX_SIDE)
+    ratio = source.width / image.width
+    if ratio != 1:
+        predictions = [
+            dict(pred, x=pred["x"] * ratio, y=pred["y"] * ratio, width=pred["width"] * ratio, height=pred["height"] * ratio)
+            for pred in predictions
+        ]
+    
+    source_path, meta_path = _source_paths(annotation_id)
+    source.save(source_path, "JPEG", quality=ANNOTATION_SOURCE_QUALITY)
+    # Metadata last: its presence marks the pending render as complete
+    with open(meta_path, "w") as f:
+        json.dump({"predictions": predictions, "model_sources": model_sources, "suffix": suffix, "keep": keep}, f)
+    _counters["pending_saved"] += 1
+
+async def save_pending(
+    annotation_id: str,
+    suffix: str,
+    image: Image.Image,
+    predictions: List[dict],
+    model_sources: List[str],
+    keep: bool = False,
+):
+    """
+    Persist a downscaled copy of the decoded upload + detections needed to
+    render '<annotation_id><suffix>' later. `keep`: the URL is stored in
+    history, so the sweep renders the image instead of deleting the source.
+    """
+    await run_cpu(_write_pending, annotation_id, suffix, image, predictions, model_sources, keep)
+
+def sweep_pending(max_age: float = ANNOTATION_SOURCE_TTL) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Deal with pending annotations older than `max_age` seconds: files of ones
+    nobody will look up again are deleted. Returns how many files were removed
+    plus the (annotation_id, suffix) pairs that must be rendered and kept.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    to_render = []
+    for meta_path in ANNOTATION_SOURCE_DIR.glob("*.json"):
+        try:
+            if meta_path.stat().st_mtime >= cutoff:
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            continue  # rendered (and removed) meanwhile
+        
+        annotation_id = meta_path.stem
+        # Metadata written before "keep" existed: assume the URL was saved
+        if meta.get("keep", True):
+            to_render.append((annotation_id, meta.get("suffix", ANNOTATED_SUFFIX)))
+            continue
+        for path in _source_paths(annotation_id):
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+    
+    # Sources whose metadata never got written (crash in between)
+    for path in ANNOTATION_SOURCE_DIR.glob("*.src"):
+        try:
+            if path.stat().st_mtime < cutoff and not path.with_suffix(".json").exists():
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    _counters["expired_files"] += removed
+    return removed, to_render
+
+async def _sweep_loop(interval: float, max_age: float):
+    while True:
+        try:
+            removed, to_render = await run_io(sweep_pending, max_age)
+            if removed:
+                print(f"🧹 Removed {removed} expired pending annotation file(s)")
+            for annotation_id, suffix in to_render:
+                if await _render_once(annotation_id, suffix):
+                    _counters["expired_rendered"] += 1
+        except Exception as e:
+            print(f"⚠️ Pending annotation sweep failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+def start_sweeper(interval: float = ANNOTATION_SWEEP_INTERVAL, max_age: float = ANNOTATION_SOURCE_TTL):
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.get_running_loop().create_task(_sweep_loop(interval, max_age))
+
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
+
+def parse_filename(filename: str) -> Tuple[str, Optional[str], str]:
+    """'<id>_thumb.webp' -> ('<id>', 'thumb', '.webp'); the full-size image has variant None"""
+    path = Path(filename)
+    stem, suffix = path.stem, path.suffix
+    for variant in ANNOTATION_VARIANTS:
+        if stem.endswith(f"_{variant}"):
+            return stem[:-len(variant) - 1], variant, suffix
+    return stem, None, suffix
+
+def variant_urls(image_path: Optional[str]) -> Optional[Dict[str, str]]:
+    """URLs of every size variant for a stored '/annotated/<id><suffix>' image_path"""
+    if not image_path:
+        return None
+    path = Path(image_path)
+    if path.suffix.lower() not in SUFFIX_FORMATS:
+        return {"full": image_path}  # no variants can be rendered for this one
+    urls = {
+        variant: f"/annotated/{path.stem}_{variant}{path.suffix}"
+        for variant in ANNOTATION_VARIANTS
+    }
+    urls["full"] = image_path
+    return urls
+
+def _save_atomic(img: Image.Image, output_path: Path):
+    # Write to a temp name and rename, so readers never see a half-written file
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    encode_image(img, str(tmp_path), SUFFIX_FORMATS.get(output_path.suffix.lower(), "jpeg"))
+    os.replace(tmp_path, output_path)
+
+def _save_variants(full: Image.Image, annotation_id: str, suffix: str, only_missing: bool = False):
+    for variant, max_side in ANNOTATION_VARIANTS.items():
+        output_path = ANNOTATED_DIR / f"{annotation_id}_{variant}{suffix}"
+        if only_missing and output_path.exists():
+            continue
+        _save_atomic(resize_to_fit(full, max_side), output_path)
+
+def _render(annotation_id: str, suffix: str) -> bool:
+    """Draw a pending annotation and write every size variant; False if nothing to render"""
+    full_path = ANNOTATED_DIR / f"{annotation_id}{suffix}"
+    source_path, meta_path = _source_paths(annotation_id)
+    
+    if meta_path.exists():
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Only the suffix the URL was issued with renders; other suffixes leave the source alone
+            if suffix != meta.get("suffix", ANNOTATED_SUFFIX):
+                return False
+            with open(source_path, "rb") as f:
+                image = decode_image(f)
+        except FileNotFoundError:
+            return False  # expired by the sweep just now
+        
+        full = render_detections(image, meta["predictions"], model_sources=meta["model_sources"])
+        _save_variants(full, annotation_id, suffix)
+        _save_atomic(full, full_path)
+        
+        source_path.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+        _counters["rendered"] += 1
+        print(f"📸 Annotated image rendered: {full_path}")
+        return True
+    
+    if full_path.exists():
+        # Images rendered before variants existed: derive the smaller sizes from the full one
+        with Image.open(full_path) as img:
+            img.load()
+            _save_variants(img.convert("RGB"), annotation_id, suffix, only_missing=True)
+        print(f"📸 Size variants generated for: {full_path}")
+        return True
+    
+    return False
+
+async def get_annotated(filename: str) -> Optional[Path]:
+    """Path of an annotated image (any size variant), rendering it first if needed; None if unknown"""
+    output_path = ANNOTATED_DIR / filename
+    if output_path.exists():
+        return output_path
+    
+    annotation_id, _, suffix = parse_filename(filename)
+    if suffix.lower() not in SUFFIX_FORMATS:  # legacy images may be named '.JPG'
+        return None
+    
+    await _render_once(annotation_id, suffix)
+    return output_path if output_path.exists() else None
+
+async def _render_once(annotation_id: str, suffix: str) -> bool:
+    """_render on the CPU pool, shared by every caller asking for the same image meanwhile"""
+    key = (annotation_id, suffix)
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(run_cpu(_render, annotation_id, suffix))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # shield: a client disconnecting must not cancel the render other requests await
+    return await asyncio.shield(future)
@@ -0,0 +1,74 @@
+import os
+import json
+import time
+from typing import Callable, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+# Generic driver for one-off data fixes over a table with an integer id:
+# walks the id space in fixed-size ranges, one short transaction per range,
+# records the last finished id in a checkpoint file so an interrupted run
+# resumes where it stopped, and prints progress as it goes.
+
+# apply(db, low_id, high_id, dry_run) -> rows changed in (low_id, high_id]
+ApplyRange = Callable[[Session, int, int, bool], int]
+
+def _load_checkpoint(path: str, name: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("task") != name:
+        raise ValueError(f"Checkpoint {path} belongs to task {data.get('task')!r}, not {name!r}")
+    return int(data["last_id"])
+
+def _save_checkpoint(path: str, name: str, last_id: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"task": name, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+def run_backfill(
+    db: Session,
+    name: str,
+    id_column,
+    apply: ApplyRange,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+    checkpoint_path: Optional[str] = None,
+    restart: bool = False,
+) -> int:
+    """
+    Run `apply` over every id range of `id_column`'s table, committing per range.
+    Dry runs never write rows or checkpoints. Returns the number of rows changed
+    (or that would change).
+    """
+    checkpoint_path = checkpoint_path or f".backfill_{name}.json"
+    start_id = 0 if restart or dry_run else _load_checkpoint(checkpoint_path, name)
+    max_id = db.execute(select(func.max(id_column))).scalar() or 0
+    remaining = db.execute(select(func.count()).where(id_column > start_id)).scalar()
+    
+    if start_id:
+        print(f"↩️ Resuming {name} after id {start_id}")
+    print(f"🔎 {name}: {remaining} rows to check (ids {start_id + 1}..{max_id}){' [dry run]' if dry_run else ''}")
+    
+    changed = 0
+    low_id = start_id
+    started = time.perf_counter()
+    while low_id < max_id:
+        high_id = min(low_id + chunk_size, max_id)
+        changed += apply(db, low_id, high_id, dry_run)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+            _save_checkpoint(checkpoint_path, name, high_id)
+        low_id = high_id
+        
+        elapsed = time.perf_counter() - started
+        done = max_id - start_id and (high_id - start_id) / (max_id - start_id) * 100
+        print(f"   … id {high_id}/{max_id} ({done:.0f}%), {changed} changed, {elapsed:.1f}s")
+    
+    if not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # finished: the next run starts from the beginning
+    return changed
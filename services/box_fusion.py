@@ -0,0 +1,102 @@
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+
+# Cross-model duplicate suppression. The primary and secondary models often
+# box the same lesion; a secondary box overlapping a primary box of an
+# equivalent class by at least BOX_FUSION_IOU is fused into it (weighted box
+# fusion: coordinates averaged by confidence, best confidence kept) instead
+# of being counted and drawn twice.
+BOX_FUSION_IOU = float(os.getenv("BOX_FUSION_IOU", "0.4"))
+
+# Lower-cased class name (from either model) -> equivalence group.
+# Classes not listed only match the same name.
+CLASS_EQUIVALENCE = {
+    "acne": "acne",
+    "pimples": "acne",
+    "papular": "acne",
+    "cystic": "acne",
+    "purulent": "acne",
+    "conglobata": "acne",
+    "melasma": "melasma",
+    "rosacea": "rosacea",
+}
+
+Prediction = Dict[str, Any]
+
+def equivalence_group(class_name: str) -> str:
+    name = class_name.lower()
+    return CLASS_EQUIVALENCE.get(name, name)
+
+def boxes_xyxy(predictions: Sequence[Prediction]) -> np.ndarray:
+    """Roboflow center/size boxes -> (N, 4) corner boxes"""
+    if not predictions:
+        return np.zeros((0, 4))
+    boxes = np.array([[p["x"], p["y"], p["width"], p["height"]] for p in predictions], dtype=np.float64)
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of corner boxes: (N, 4) x (M, 4) -> (N, M)"""
+    a_x1, a_y1, a_x2, a_y2 = (column[:, None] for column in a.T)
+    b_x1, b_y1, b_x2, b_y2 = b.T
+    inter = (np.minimum(a_x2, b_x2) - np.maximum(a_x1, b_x1)).clip(0)
+    inter *= (np.minimum(a_y2, b_y2) - np.maximum(a_y1, b_y1)).clip(0)
+    union = ((a_x2 - a_x1) * (a_y2 - a_y1)) + ((b_x2 - b_x1) * (b_y2 - b_y1)) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def _merge(primary: Prediction, secondary: Prediction) -> Prediction:
+    primary_weight = primary.get("confidence", 0)
+    secondary_weight = secondary.get("confidence", 0)
+    total = primary_weight + secondary_weight or 1.0
+    fused = dict(primary)  # the primary model's (more specific) class wins
+    for key in ("x", "y", "width", "height"):
+        fused[key] = (primary[key] * primary_weight + secondary[key] * secondary_weight) / total
+    fused["confidence"] = max(primary_weight, secondary_weight)
+    return fused
+
+def fuse_predictions(
+    primary: Sequence[Prediction],
+    secondary: Sequence[Prediction],
+    iou_threshold: float = BOX_FUSION_IOU,
+) -> Tuple[List[Prediction], List[Prediction], int]:
+    """
+    Returns (primary, secondary, merged): the primary predictions with their
+    matched secondary boxes fused in, the secondary predictions that matched
+    nothing, and how many pairs were fused. Matching is one-to-one, best IoU first.
+    """
+    primary = list(primary)
+    secondary = list(secondary)
+    if not primary or not secondary:
+        return primary, secondary, 0
+    
+    primary_boxes = boxes_xyxy(primary)
+    secondary_boxes = boxes_xyxy(secondary)
+    primary_groups = np.array([equivalence_group(p.get("class", "")) for p in primary])
+    secondary_groups = np.array([equivalence_group(p.get("class", "")) for p in secondary])
+    
+    # Candidate pairs, one IoU block per equivalence group present in both models
+    pair_rows, pair_cols, pair_ious = [], [], []
+    for group in np.intersect1d(primary_groups, secondary_groups):
+        rows = np.flatnonzero(primary_groups == group)
+        cols = np.flatnonzero(secondary_groups == group)
+        iou = iou_matrix(primary_boxes[rows], secondary_boxes[cols])
+        hit_rows, hit_cols = np.nonzero((iou >= iou_threshold) & (iou > 0))
+        pair_rows.append(rows[hit_rows])
+        pair_cols.append(cols[hit_cols])
+        pair_ious.append(iou[hit_rows, hit_cols])
+    if not pair_ious or not sum(len(ious) for ious in pair_ious):
+        return primary, secondary, 0
+    
+    order = np.argsort(-np.concatenate(pair_ious), kind="stable")
+    pairs = np.stack([np.concatenate(pair_rows)[order], np.concatenate(pair_cols)[order]], axis=1)
+    
+    primary_used = np.zeros(len(primary), dtype=bool)
+    secondary_used = np.zeros(len(secondary), dtype=bool)
+    for i, j in pairs:
+        if primary_used[i] or secondary_used[j]:
+            continue
+        primary_used[i] = secondary_used[j] = True
+        primary[i] = _merge(primary[i], secondary[j])
+    
+    remaining = [prediction for j, prediction in enumerate(secondary) if not secondary_used[j]]
+    return primary, remaining, int(secondary_used.sum())
@@ -0,0 +1,138 @@
+import os
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from services import roboflow
+from services.roboflow import PRIMARY_TIMEOUT, SECONDARY_TIMEOUT
+from services.http_client import CircuitBreaker
+
+# Which implementation serves each model role, chosen per model:
+#   roboflow - hosted HTTP API (default)
+#   onnx     - exported YOLO-style weights run locally on ONNX Runtime
+#              (services.onnx_detector; needs onnxruntime installed)
+# Every backend returns Roboflow's response shape, in inference-image pixels:
+#   {"predictions": [{"x", "y", "width", "height", "confidence", "class", ...}], ...}
+PRIMARY_DETECTOR = os.getenv("PRIMARY_DETECTOR", "roboflow").lower()
+SECONDARY_DETECTOR = os.getenv("SECONDARY_DETECTOR", "roboflow").lower()
+
+ROLES = ("primary", "secondary")
+
+
+class Detector(ABC):
+    """One detection model behind a backend"""
+    
+    backend = "base"
+    
+    def __init__(self, role: str):
+        self.role = role
+    
+    def load(self):
+        """Load weights etc.; called once at startup"""
+    
+    def timed_out(self):
+        """detect() was cancelled by the per-model timeout in analyze_both"""
+    
+    @abstractmethod
+    async def detect(self, image_bytes: bytes, filename: str = "image.jpg") -> Dict[str, Any]:
+        """Predictions in Roboflow's response shape, in inference-image pixels"""
+
+
+class RoboflowDetector(Detector):
+    """Hosted Roboflow model (retries, circuit breaker and caching live in services.roboflow)"""
+    
+    backend = "roboflow"
+    
+    def __init__(
+        self,
+        role: str,
+        call: Callable[[bytes, str], Awaitable[Dict[str, Any]]],
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(role)
+        self._call = call
+        self._breaker = breaker
+    
+    async def detect(self, image_bytes: bytes, filename: str = "image.jpg") -> Dict[str, Any]:
+        return await self._call(image_bytes, filename)
+    
+    def timed_out(self):
+        if self._breaker is not None:
+            self._breaker.record_failure()
+
+
+def _build(role: str, backend: str) -> Detector:
+    if backend == "roboflow":
+        if role == "primary":
+            return RoboflowDetector(role, roboflow.analyze_image_async)
+        return RoboflowDetector(role, roboflow.analyze_secondary_async, breaker=roboflow.secondary_breaker)
+    if backend == "onnx":
+        from services.onnx_detector import OnnxDetector  # optional dependencies, only when configured
+        prefix = f"ONNX_{role.upper()}"
+        primary = role == "primary"
+        return OnnxDetector(
+            role,
+            model_path=os.getenv(f"{prefix}_MODEL"),
+            classes=os.getenv(f"{prefix}_CLASSES"),
+            confidence=roboflow.PRIMARY_CONFIDENCE if primary else roboflow.SECONDARY_CONFIDENCE,
+            overlap=roboflow.PRIMARY_OVERLAP if primary else roboflow.SECONDARY_OVERLAP,
+        )
+    raise RuntimeError(f"Unknown {role} detector backend {backend!r} (expected 'roboflow' or 'onnx')")
+
+_detectors: Dict[str, Detector] = {}
+
+def get_detector(role: str) -> Detector:
+    detector = _detectors.get(role)
+    if detector is None:
+        detector = _build(role, PRIMARY_DETECTOR if role == "primary" else SECONDARY_DETECTOR)
+        _detectors[role] = detector
+    return detector
+
+def load_detectors():
+    """Build and load every configured detector, so a bad config fails at startup"""
+    for role in ROLES:
+        detector = get_detector(role)
+        detector.load()
+        print(f"🧠 {role.title()} detector: {detector.backend}")
+
+async def _reporting(model: str, call: Awaitable[Dict[str, Any]], on_done: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    try:
+        return await call
+    finally:
+        if on_done is not None:
+            on_done(model)
+
+async def analyze_both(
+    image_bytes: bytes,
+    filename: str = "image.jpg",
+    on_done: Optional[Callable[[str], None]] = None,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[Exception]]:
+    """
+    Run primary and secondary models at the same time.
+    Returns (primary_result, secondary_result, secondary_error).
+    Primary failures are raised as soon as they happen (the secondary call is cancelled);
+    secondary failures are returned so the caller can carry on without them.
+    `on_done("primary" | "secondary")` is called as each model call finishes (either way).
+    """
+    primary_detector = get_detector("primary")
+    secondary_detector = get_detector("secondary")
+    primary = asyncio.ensure_future(_reporting("primary", asyncio.wait_for(primary_detector.detect(image_bytes, filename), timeout=PRIMARY_TIMEOUT), on_done))
+    secondary = asyncio.ensure_future(_reporting("secondary", asyncio.wait_for(secondary_detector.detect(image_bytes, filename), timeout=SECONDARY_TIMEOUT), on_done))
+    
+    try:
+        primary_result = await primary
+    except BaseException as e:
+        # No point waiting for the secondary model without a primary result
+        secondary.cancel()
+        await asyncio.gather(secondary, return_exceptions=True)
+        if isinstance(e, asyncio.TimeoutError):
+            raise Exception(f"Primary detector ({primary_detector.backend}) timed out after {PRIMARY_TIMEOUT}s")
+        raise
+    
+    secondary_result, = await asyncio.gather(secondary, return_exceptions=True)
+    if isinstance(secondary_result, asyncio.TimeoutError):
+        secondary_detector.timed_out()
+        return primary_result, None, Exception(f"Secondary detector ({secondary_detector.backend}) timed out after {SECONDARY_TIMEOUT}s")
+    if isinstance(secondary_result, BaseException):
+        return primary_result, None, secondary_result
+    
+    return primary_result, secondary_result, None
@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Dict
+from services import metrics
+
+# Execution model for request handlers:
+#   - cpu: image decoding/drawing, HEIC conversion
+#     (bcrypt has its own process pool in services.passwords)
+#   - io:  blocking file and database calls
+# Anything awaited on the event loop itself must be non-blocking.
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 2)))
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "16"))
+
+class BoundedExecutor:
+    """Fixed-size thread pool that tracks queue depth and queue wait time"""
+    
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+    
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.perf_counter()
+        
+        with self._lock:
+            self._queued += 1
+        
+        def call():
+            waited = time.perf_counter() - enqueued_at
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+        
+        return await loop.run_in_executor(self._pool, call)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._active
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "avg_wait_ms": round(self._wait_total / started * 1000, 3) if started else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+    
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+cpu_pool = BoundedExecutor("cpu", CPU_POOL_WORKERS)
+io_pool = BoundedExecutor("io", IO_POOL_WORKERS)
+
+metrics.register("cpu_pool", cpu_pool.stats)
+metrics.register("io_pool", io_pool.stats)
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-bound work (PIL) off the event loop"""
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run blocking file/DB work off the event loop"""
+    return await io_pool.run(fn, *args, **kwargs)
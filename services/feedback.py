@@ -0,0 +1,263 @@
+import os
+import json
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from services import metrics
+
+# Feedback and recommendations for a detection summary, declared as data:
+#   clear     - returned as-is when nothing was detected
+#   rules     - in order; a rule fires when any of its `classes` was detected
+#               (and, if it has `more_than`, when the summed count of its
+#               `count_classes` exceeds that). Fired rules contribute their
+#               recommendations, first occurrence wins.
+#   general   - filler used while fewer than `below` recommendations fired,
+#               never growing the list past `max`
+#   severity  - total detections -> level, first band whose `max` is not exceeded
+#
+# The rules are compiled once into bitmasks: every class maps to the set of
+# rules it can fire, so a summary is evaluated by OR-ing its classes' masks,
+# and the final recommendation list is memoized per set of fired rules.
+#
+# FEEDBACK_RULES_FILE (JSON in the DEFAULT_RULES shape) replaces the built-in
+# rules. The file is re-read when its mtime changes, checked at most every
+# FEEDBACK_RULES_CHECK_INTERVAL seconds; a file that fails to load is
+# reported and the previous rules stay in place.
+FEEDBACK_RULES_FILE = os.getenv("FEEDBACK_RULES_FILE")
+FEEDBACK_RULES_CHECK_INTERVAL = float(os.getenv("FEEDBACK_RULES_CHECK_INTERVAL", "2"))
+
+MAX_MEMOIZED = 1024
+
+DEFAULT_RULES: Dict[str, Any] = {
+    "clear": {
+        "feedback": "Great news! No skin concerns detected. Your skin looks healthy!",
+        "recommendations": [
+            "Maintain your current skincare routine",
+            "Continue using sunscreen daily (SPF 30+)",
+            "Stay hydrated and get adequate sleep",
+            "Cleanse gently twice daily",
+        ],
+    },
+    "rules": [
+        {
+            "classes": ["cystic", "purulent", "Acne", "conglobata", "Pimples"],
+            "recommendations": [
+                "Use a gentle cleanser with salicylic acid (2%) or benzoyl peroxide (2.5-5%)",
+                "Apply spot treatment to active breakouts",
+                "Avoid touching or picking at your face",
+                "Change pillowcases regularly",
+            ],
+        },
+        {
+            "classes": ["cystic", "purulent", "conglobata"],
+            "count_classes": ["cystic", "purulent"],
+            "more_than": 3,
+            "recommendations": [
+                "Consider consulting a dermatologist for prescription treatments (this may require professional care)",
+            ],
+        },
+        {
+            "classes": ["blackhead"],
+            "recommendations": [
+                "Use a BHA (salicylic acid) exfoliant 2-3 times per week",
+                "Try oil cleansing to help dissolve sebum",
+                "Consider professional extractions for stubborn blackheads",
+            ],
+        },
+        {
+            "classes": ["whitehead"],
+            "recommendations": [
+                "Use products with salicylic acid to unclog pores",
+                "Avoid heavy, pore-clogging moisturizers",
+                "Don't squeeze whiteheads - let them heal naturally",
+            ],
+        },
+        {
+            "classes": ["acne_scars"],
+            "recommendations": [
+                "Apply vitamin C serum to help fade scarring",
+                "Use products with niacinamide for skin repair",
+                "Always wear SPF 30+ to prevent darkening of scars",
+                "Consider professional treatments (microneedling, laser) for severe scarring",
+            ],
+        },
+        {
+            "classes": ["milium"],
+            "recommendations": [
+                "Milia may require professional extraction - avoid trying to remove them yourself",
+            ],
+        },
+    ],
+    "general": {
+        "below": 3,
+        "max": 5,
+        "recommendations": [
+            "Maintain a consistent skincare routine",
+            "Avoid harsh scrubbing or over-exfoliation",
+            "Keep hair and hands away from your face",
+        ],
+    },
+    "severity": [
+        {"max": 5, "level": "mild"},
+        {"max": 15, "level": "moderate"},
+        {"level": "severe"},
+    ],
+}
+
+
+class CompiledRules:
+    """A rule set compiled into class -> rule bitmasks"""
+    
+    def __init__(self, rules: Mapping[str, Any]):
+        try:
+            self.clear_feedback = str(rules["clear"]["feedback"])
+            self.clear_recommendations = [str(rec) for rec in rules["clear"]["recommendations"]]
+            
+            self.class_masks: Dict[str, int] = {}
+            self.recommendations: List[Tuple[str, ...]] = []
+            self.thresholds: Dict[int, Tuple[Tuple[str, ...], float]] = {}
+            for i, rule in enumerate(rules["rules"]):
+                bit = 1 << i
+                if isinstance(rule["classes"], str):
+                    raise ValueError(f"rule {i}: 'classes' must be a list")
+                for name in rule["classes"]:
+                    self.class_masks[name] = self.class_masks.get(name, 0) | bit
+                self.recommendations.append(tuple(str(rec) for rec in rule["recommendations"]))
+                if "more_than" in rule:
+                    count_classes = tuple(rule.get("count_classes", rule["classes"]))
+                    self.thresholds[bit] = (count_classes, float(rule["more_than"]))
+            self.threshold_mask = sum(self.thresholds)
+            
+            general = rules["general"]
+            self.general_below = int(general["below"])
+            self.general_max = int(general["max"])
+            self.general_recommendations = [str(rec) for rec in general["recommendations"]]
+            
+            bands = rules["severity"]
+            if not bands:
+                raise ValueError("no severity bands")
+            self.severity_bounds = [float(band["max"]) for band in bands[:-1]]
+            self.severity_levels = [str(band["level"]) for band in bands]
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            raise ValueError(f"Malformed feedback rules: {e!r}") from e
+        if self.severity_bounds != sorted(self.severity_bounds):
+            raise ValueError("Malformed feedback rules: severity bands must be in increasing order")
+        
+        self.rule_count = len(self.recommendations)
+        self._memo: Dict[int, Tuple[str, ...]] = {}
+        self._readable: Dict[str, str] = {}
+    
+    def fired(self, summary: Mapping[str, int]) -> int:
+        """Bitmask of the rules a summary fires"""
+        class_masks = self.class_masks
+        mask = 0
+        for name in summary:
+            mask |= class_masks.get(name, 0)
+        pending = mask & self.threshold_mask
+        while pending:
+            bit = pending & -pending
+            count_classes, more_than = self.thresholds[bit]
+            if not sum(summary.get(name, 0) for name in count_classes) > more_than:
+                mask &= ~bit
+            pending &= pending - 1
+        return mask
+    
+    def recommend(self, mask: int) -> Tuple[str, ...]:
+        recommendations = self._memo.get(mask)
+        if recommendations is None:
+            recommendations = self._build(mask)
+            if len(self._memo) >= MAX_MEMOIZED:
+                self._memo.clear()
+            self._memo[mask] = recommendations
+        return recommendations
+    
+    def _build(self, mask: int) -> Tuple[str, ...]:
+        # dict keeps first-occurrence order: rule order, then order within each rule
+        recommendations = {}
+        for i, recs in enumerate(self.recommendations):
+            if mask >> i & 1:
+                recommendations.update(dict.fromkeys(recs))
+        if len(recommendations) < self.general_below:
+            for rec in self.general_recommendations:
+                if len(recommendations) >= self.general_max:
+                    break
+                recommendations.setdefault(rec)
+        return tuple(recommendations)
+    
+    def readable(self, name: str) -> str:
+        readable = self._readable.get(name)
+        if readable is None:
+            readable = name.replace('_', ' ').title()
+            if len(self._readable) < MAX_MEMOIZED:  # class names come from the models, but stay bounded
+                self._readable[name] = readable
+        return readable
+    
+    def severity(self, total: float) -> str:
+        return self.severity_levels[bisect_left(self.severity_bounds, total)]
+    
+    def evaluate(self, summary: Mapping[str, int]) -> Tuple[str, str, List[str]]:
+        """(severity, feedback, recommendations) for a detection summary"""
+        total = sum(summary.values())
+        if total == 0:
+            return "clear", self.clear_feedback, list(self.clear_recommendations)
+        
+        readable = self._readable
+        concerns = ", ".join([f"{count} {readable.get(name) or self.readable(name)}" for name, count in summary.items()])
+        recommendations = self.recommend(self.fired(summary))
+        return self.severity(total), f"Analysis detected: {concerns}.", list(recommendations)
+
+
+class RuleSet:
+    """The active compiled rules, reloaded from `path` when the file changes"""
+    
+    def __init__(self, default: Mapping[str, Any], path: Optional[str] = None, check_interval: float = FEEDBACK_RULES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.compiled = CompiledRules(default)
+        self.source = "built-in"
+        self._mtime: Optional[int] = None
+        self._missing = False
+        self._next_check = 0.0
+        self._counters = {"reloads": 0, "errors": 0}
+        if path:
+            self._check()
+        metrics.register("feedback_rules", self.stats)
+    
+    def current(self) -> CompiledRules:
+        if self.path and time.monotonic() >= self._next_check:
+            self._check()
+        return self.compiled
+    
+    def _check(self):
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if not self._missing:  # reported once until the file is back
+                self._missing = True
+                self._counters["errors"] += 1
+                print(f"⚠️ Feedback rules file {self.path} unavailable ({e}), keeping the current rules ({self.source})")
+            return
+        self._missing = False
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime  # a broken file is reported once, not on every check
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                compiled = CompiledRules(json.load(f))
+        except (OSError, ValueError) as e:
+            self._counters["errors"] += 1
+            print(f"⚠️ Could not load feedback rules from {self.path}: {e}; keeping the current rules ({self.source})")
+            return
+        self.compiled = compiled
+        self.source = self.path
+        self._counters["reloads"] += 1
+        print(f"📋 Loaded {compiled.rule_count} feedback rules from {self.path}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._counters, source=self.source, rules=self.compiled.rule_count)
+
+feedback_rules = RuleSet(DEFAULT_RULES, FEEDBACK_RULES_FILE)
+
+def evaluate_feedback(detection_summary: Mapping[str, int]) -> Tuple[str, str, List[str]]:
+    return feedback_rules.current().evaluate(detection_summary)
@@ -0,0 +1,35 @@
+import hashlib
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+# Annotated images never change once rendered (new analysis => new filename).
+# private: they are photos of users' faces, so only the browser may keep them, not shared caches/CDNs
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Per-user lists: always revalidate, but a matching ETag costs only a 304
+PRIVATE_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+def file_etag(stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already covers `etag`"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+def cached_json(request: Request, content, cache_control: str = PRIVATE_REVALIDATE_CACHE_CONTROL) -> Response:
+    """JSONResponse with a content-hash ETag; answers 304 when the client copy is current"""
+    response = JSONResponse(content)
+    etag = f'"{hashlib.sha1(response.body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if is_not_modified(request, etag):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return response
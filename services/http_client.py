@@ -0,0 +1,217 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional
+from services import metrics
+
+# Shared, long-lived HTTP clients for outbound API calls (Roboflow).
+# One pooled keep-alive client per flavour so each analysis reuses warm
+# TCP/TLS connections instead of handshaking on every request.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.25"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "4"))
+# The `timeout` given to post_with_retries* is the budget for the whole call,
+# retries included; a single attempt may use at most HTTP_ATTEMPT_TIMEOUT of
+# it, so a stalled connection is retried on a fresh one within the budget.
+HTTP_ATTEMPT_TIMEOUT = float(os.getenv("HTTP_ATTEMPT_TIMEOUT", "12"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sync_session: Optional[requests.Session] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_session_lock = threading.Lock()
+
+_counters = {"requests": 0, "retries": 0, "failures": 0}
+_counters_lock = threading.Lock()
+
+def _count(key: str):
+    with _counters_lock:
+        _counters[key] += 1
+
+def _http_stats() -> Dict[str, Any]:
+    with _counters_lock:
+        return dict(_counters, pool_size=HTTP_POOL_SIZE)
+
+metrics.register("http_client", _http_stats)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is skipped because its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    closed -> open after `failure_threshold` failures in a row;
+    open -> half-open after `reset_timeout` seconds (one trial call);
+    half-open -> closed on success, back to open on failure.
+    """
+    
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._skipped = 0
+        metrics.register(f"circuit_{name}", self.stats)
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+                return True
+            self._skipped += 1
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+    
+    def record_cancelled(self):
+        """A call abandoned by its caller says nothing about the remote side: a half-open trial is handed to the next call"""
+        with self._lock:
+            if self._state == "half_open":
+                self._state = "open"  # _opened_at is old enough that the next allow() is the trial
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    print(f"⚡ Circuit '{self.name}' opened after {self._failures} failure(s)")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "skipped_calls": self._skipped,
+            }
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Exponential backoff with full jitter; honours a numeric Retry-After header"""
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), HTTP_BACKOFF_MAX))
+        except ValueError:
+            pass
+    return delay
+
+
+def get_sync_session() -> requests.Session:
+    """Process-wide requests.Session with a pooled keep-alive adapter"""
+    global _sync_session
+    if _sync_session is None:
+        with _session_lock:
+            if _sync_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sync_session = session
+    return _sync_session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Process-wide httpx.AsyncClient with a pooled keep-alive transport"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            )
+        )
+    return _async_client
+
+
+async def close_clients():
+    """Close pooled connections (called on app shutdown)"""
+    global _async_client, _sync_session
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
+
+
+def _attempt_timeout(deadline: float, attempt_timeout: float) -> float:
+    return max(0.01, min(attempt_timeout, deadline - time.monotonic()))
+
+
+def _give_up(attempt: int, deadline: float, delay: float) -> bool:
+    """No retries left, or no time left in the budget for another attempt"""
+    return attempt == HTTP_MAX_RETRIES or time.monotonic() + delay >= deadline
+
+
+def post_with_retries(url: str, timeout: float, attempt_timeout: float = HTTP_ATTEMPT_TIMEOUT, **kwargs) -> requests.Response:
+    """POST through the shared session, retrying 429/5xx, connection errors and timed-out attempts"""
+    session = get_sync_session()
+    deadline = time.monotonic() + timeout
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        _count("requests")
+        error = None
+        try:
+            response = session.post(url, timeout=_attempt_timeout(deadline, attempt_timeout), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error, retry_after = e, None
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            retry_after = response.headers.get("Retry-After")
+        
+        delay = backoff_delay(attempt, retry_after)
+        if _give_up(attempt, deadline, delay):
+            if error is not None:
+                _count("failures")
+                raise error
+            return response
+        _count("retries")
+        print(f"🔁 Retrying {url} in {delay:.2f}s (attempt {attempt + 2}/{HTTP_MAX_RETRIES + 1})")
+        time.sleep(delay)
+
+
+async def post_with_retries_async(url: str, timeout: float, attempt_timeout: float = HTTP_ATTEMPT_TIMEOUT, **kwargs) -> httpx.Response:
+    """Async POST through the shared client, retrying 429/5xx, connection errors and timed-out attempts"""
+    client = get_async_client()
+    deadline = time.monotonic() + timeout
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        _count("requests")
+        error = None
+        try:
+            response = await client.post(url, timeout=_attempt_timeout(deadline, attempt_timeout), **kwargs)
+        except httpx.TransportError as e:
+            error, retry_after = e, None
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            retry_after = response.headers.get("Retry-After")
+        
+        delay = backoff_delay(attempt, retry_after)
+        if _give_up(attempt, deadline, delay):
+            if error is not None:
+                _count("failures")
+                raise error
+            return response
+        _count("retries")
+        print(f"🔁 Retrying {url} in {delay:.2f}s (attempt {attempt + 2}/{HTTP_MAX_RETRIES + 1})")
+        await asyncio.sleep(delay)
@@ -1,59 +1,202 @@
-from PIL import Image, ImageDraw, ImageFont
+import os
+from io import BytesIO
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Any, BinaryIO
+
+# Detector input size: the hosted models run at ~640px, so anything bigger is wasted upload
+INFERENCE_MAX_SIDE = int(os.getenv("INFERENCE_MAX_SIDE", "640"))
+INFERENCE_JPEG_QUALITY = int(os.getenv("INFERENCE_JPEG_QUALITY", "85"))
+
+# Dimension limits checked from the image header, before any pixel data is decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+MAX_IMAGE_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "12000"))
+
+# Annotated output: drawn on a copy capped at ANNOTATION_MAX_SIDE, encoded as ANNOTATED_FORMAT
+ANNOTATION_MAX_SIDE = int(os.getenv("ANNOTATION_MAX_SIDE", "1600"))
+ANNOTATED_FORMAT = os.getenv("ANNOTATED_FORMAT", "webp").lower()  # webp | jpeg | png
+ANNOTATED_QUALITY = int(os.getenv("ANNOTATED_QUALITY", "82"))
+
+ANNOTATED_SUFFIXES = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+ANNOTATED_SUFFIX = ANNOTATED_SUFFIXES.get(ANNOTATED_FORMAT, ".jpg")
+SUFFIX_FORMATS = {".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp", ".png": "png"}
+
+# Size variants produced for every annotated image (max side in px); "full" is the
+# ANNOTATION_MAX_SIDE render itself and keeps the plain /annotated/<id><suffix> name
+ANNOTATION_VARIANTS = {
+    "thumb": int(os.getenv("ANNOTATION_THUMB_SIDE", "256")),
+    "medium": int(os.getenv("ANNOTATION_MEDIUM_SIDE", "768")),
+}
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_SIZE = 20
+
+def _hex_to_rgb(color_hex: str) -> Tuple[int, int, int]:
+    return tuple(int(color_hex.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+
+# Color mapping for different model sources
+SOURCE_COLORS = {
+    'primary': (255, 0, 0),      # Red for acne/primary detections
+    'secondary': (0, 150, 255),  # Blue for secondary conditions
+    'default': (255, 107, 107)   # Default red
+}
+
+# Class-specific colors (fallback if no source specified), parsed to RGB once
+CLASS_COLORS = {name: _hex_to_rgb(color_hex) for name, color_hex in {
+    'Pimples': '#FF6B6B',      # Red
+    'Acne': '#FF6B6B',         # Red
+    'blackhead': '#4ECDC4',    # Teal
+    'whitehead': '#95E1D3',    # Light teal
+    'cystic': '#FF0000',       # Bright red
+    'acne_scars': '#FFA07A',   # Light salmon
+    'papular': '#FF8C69',      # Salmon
+    'purulent': '#DC143C',     # Crimson
+    'conglobata': '#8B0000',   # Dark red
+    'folliculitis': '#FFB6C1', # Light pink
+    'milium': '#FFDAB9',       # Peach
+    'keloid': '#CD5C5C',       # Indian red
+    'flat_wart': '#F08080',    # Light coral
+    'syringoma': '#FFE4E1',    # Misty rose
+    'crystalline': '#B0E0E6',  # Powder blue
+    'melasma': '#8B4513',      # Brown for melasma
+    'rosacea': '#FF69B4',      # Pink for rosacea
+}.items()}
+DEFAULT_CLASS_COLOR = _hex_to_rgb('#FF6B6B')
+
+def _load_font():
+    try:
+        return ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    except OSError:
+        return ImageFont.load_default()
+
+LABEL_FONT = _load_font()
+
+@lru_cache(maxsize=4096)
+def label_size(label: str, font=LABEL_FONT) -> Tuple[int, int]:
+    """(width, height) of a rendered label, memoized per (label, font)"""
+    try:
+        bbox = font.getbbox(label)
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except AttributeError:
+        # Fallback for older PIL versions
+        return 150, 20
+
+class ImageTooLargeError(Exception):
+    """Image header declares dimensions over MAX_IMAGE_PIXELS / MAX_IMAGE_SIDE"""
+
+def decode_image(source: BinaryIO) -> Image.Image:
+    """
+    Decode an upload (JPEG/PNG/WebP/HEIC) exactly once into an upright RGB image.
+    Every later stage (inference prep, annotation) works on this object.
+    """
+    with Image.open(source) as img:
+        # Image.open only parses the header, so this rejects huge images without decoding them
+        width, height = img.size
+        if width * height > MAX_IMAGE_PIXELS or max(width, height) > MAX_IMAGE_SIDE:
+            raise ImageTooLargeError(f"Image dimensions {width}x{height} exceed the allowed size")
+        img.load()
+        ImageOps.exif_transpose(img, in_place=True)
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+def prepare_for_inference(image: Image.Image, max_side: int = INFERENCE_MAX_SIDE) -> Tuple[bytes, Tuple[float, float]]:
+    """
+    Downscale a decoded image to `max_side` and re-encode it as an in-memory
+    JPEG shared by both detector calls.
+    Returns (jpeg_bytes, (scale_x, scale_y)) where original = inference * scale.
+    """
+    width, height = image.size
+    prepared = image
+    
+    if max(prepared.size) > max_side:
+        ratio = max_side / max(prepared.size)
+        target = (max(1, round(prepared.width * ratio)), max(1, round(prepared.height * ratio)))
+        prepared = prepared.resize(target, Image.LANCZOS)
+    
+    buffer = BytesIO()
+    prepared.save(buffer, "JPEG", quality=INFERENCE_JPEG_QUALITY)
+    
+    scale = (width / prepared.width, height / prepared.height)
+    print(f"🗜️ Prepared {width}x{height} -> {prepared.width}x{prepared.height} for inference ({buffer.tell() // 1024} KB)")
+    return buffer.getvalue(), scale
+
+def rescale_result(result: Dict[str, Any], scale: Tuple[float, float]) -> Dict[str, Any]:
+    """Map detector output from inference-image space back to original-image space"""
+    scale_x, scale_y = scale
+    if scale_x == 1 and scale_y == 1:
+        return result
+    
+    predictions = []
+    for pred in result.get("predictions", []):
+        pred = dict(pred)
+        pred["x"] = pred["x"] * scale_x
+        pred["y"] = pred["y"] * scale_y
+        pred["width"] = pred["width"] * scale_x
+        pred["height"] = pred["height"] * scale_y
+        predictions.append(pred)
+    
+    rescaled = dict(result, predictions=predictions)
+    if isinstance(result.get("image"), dict):
+        rescaled["image"] = {
+            "width": round(result["image"].get("width", 0) * scale_x),
+            "height": round(result["image"].get("height", 0) * scale_y),
+        }
+    return rescaled
+
+def encode_image(img: Image.Image, output, image_format: str = ANNOTATED_FORMAT, quality: int = ANNOTATED_QUALITY):
+    """Save with encoder settings tuned for size/speed (progressive JPEG, WebP, or optimized PNG)"""
+    if image_format == "webp":
+        img.save(output, "WEBP", quality=quality, method=4)
+    elif image_format == "png":
+        img.save(output, "PNG", compress_level=6)
+    else:
+        img.save(output, "JPEG", quality=quality, progressive=True, optimize=True)
+
+def resize_to_fit(img: Image.Image, max_side: int) -> Image.Image:
+    """Downscaled copy with the longest side at `max_side` (the image itself if already small enough)"""
+    if max(img.size) <= max_side:
+        return img
+    ratio = max_side / max(img.size)
+    return img.resize((max(1, round(img.width * ratio)), max(1, round(img.height * ratio))), Image.BILINEAR)
 
 def draw_detections(
-    image_path: str, 
+    image: Image.Image, 
     predictions: list, 
     output_path: str,
-    model_sources: Optional[List[str]] = None  # NEW parameter
+    model_sources: Optional[List[str]] = None,
+    max_side: int = ANNOTATION_MAX_SIDE
 ) -> str:
     """
     Draw bounding boxes and labels on the image with color coding for model sources
     Returns path to the annotated image
     """
-    # Open image
-    img = Image.open(image_path)
-    draw = ImageDraw.Draw(img)
-    
-    # Color mapping for different model sources
-    source_colors = {
-        'primary': (255, 0, 0),      # Red for acne/primary detections
-        'secondary': (0, 150, 255),  # Blue for secondary conditions
-        'default': (255, 107, 107)   # Default red
-    }
-    
-    # Class-specific colors (fallback if no source specified)
-    class_colors = {
-        'Pimples': '#FF6B6B',      # Red
-        'Acne': '#FF6B6B',         # Red
-        'blackhead': '#4ECDC4',    # Teal
-        'whitehead': '#95E1D3',    # Light teal
-        'cystic': '#FF0000',       # Bright red
-        'acne_scars': '#FFA07A',   # Light salmon
-        'papular': '#FF8C69',      # Salmon
-        'purulent': '#DC143C',     # Crimson
-        'conglobata': '#8B0000',   # Dark red
-        'folliculitis': '#FFB6C1', # Light pink
-        'milium': '#FFDAB9',       # Peach
-        'keloid': '#CD5C5C',       # Indian red
-        'flat_wart': '#F08080',    # Light coral
-        'syringoma': '#FFE4E1',    # Misty rose
-        'crystalline': '#B0E0E6',  # Powder blue
-        'melasma': '#8B4513',      # Brown for melasma
-        'rosacea': '#FF69B4',      # Pink for rosacea
-    }
+    encode_image(render_detections(image, predictions, model_sources, max_side), output_path)
+    return output_path
+
+def render_detections(
+    image: Image.Image,
+    predictions: list,
+    model_sources: Optional[List[str]] = None,
+    max_side: int = ANNOTATION_MAX_SIDE
+) -> Image.Image:
+    """
+    Draw detections and return the annotated image (not encoded).
+    Drawing always happens on a copy (downscaled if larger than `max_side`),
+    so the caller's image stays clean for reuse.
+    """
+    img = resize_to_fit(image, max_side)
+    if img is image:
+        img = image.copy()
+    ratio = img.width / image.width
     
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-    except:
-        font = ImageFont.load_default()
+    draw = ImageDraw.Draw(img)
+    font = LABEL_FONT
     
     for idx, pred in enumerate(predictions):
-        x = pred['x']
-        y = pred['y']
-        width = pred['width']
-        height = pred['height']
+        x = pred['x'] * ratio
+        y = pred['y'] * ratio
+        width = pred['width'] * ratio
+        height = pred['height'] * ratio
         confidence = pred['confidence']
         class_name = pred.get('class', 'unknown')
         
@@ -65,12 +208,10 @@ def draw_detections(
         
         # Determine color based on model source if available
         if model_sources and idx < len(model_sources):
-            source = model_sources[idx]
-            color = source_colors.get(source, source_colors['default'])
+            color = SOURCE_COLORS.get(model_sources[idx], SOURCE_COLORS['default'])
         else:
             # Fallback to class-based colors
-            color_hex = class_colors.get(class_name, '#FF6B6B')
-            color = tuple(int(color_hex.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+            color = CLASS_COLORS.get(class_name, DEFAULT_CLASS_COLOR)
         
         # Draw bounding box
         draw.rectangle(
@@ -81,15 +222,7 @@ def draw_detections(
         
         # Draw label background
         label = f"{class_name} {confidence*100:.0f}%"
-        
-        # Get text size for background
-        try:
-            bbox = draw.textbbox((left, top), label, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except:
-            # Fallback for older PIL versions
-            text_width, text_height = 150, 20
+        text_width, text_height = label_size(label, font)
         
         # Draw label background rectangle
         draw.rectangle(
@@ -105,8 +238,4 @@ def draw_detections(
             font=font
         )
     
-    
-    # Save annotated image
-    img.save(output_path)
-    return output_path
-
+    return img
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from services.cache import LRUCache
+from services.executor import run_io
+from services import metrics
+from database import SessionLocal, InferenceCacheEntry
+
+# Detector results keyed by (normalized image hash, model id/version, params).
+# Tier 1: in-process LRU. Tier 2 (optional): the inference_cache table, shared
+# across workers/instances through the app database.
+INFERENCE_CACHE_ENTRIES = int(os.getenv("INFERENCE_CACHE_ENTRIES", "512"))
+INFERENCE_CACHE_MAX_BYTES = int(os.getenv("INFERENCE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+INFERENCE_CACHE_TTL = float(os.getenv("INFERENCE_CACHE_TTL", "3600"))
+INFERENCE_CACHE_SHARED = os.getenv("INFERENCE_CACHE_SHARED", "false").lower() in ("1", "true", "yes")
+INFERENCE_CACHE_SHARED_TTL = float(os.getenv("INFERENCE_CACHE_SHARED_TTL", str(7 * 24 * 3600)))
+
+# Request params that change the detector output (api_key deliberately excluded)
+KEY_PARAMS = ("confidence", "overlap")
+
+_memory = LRUCache(
+    max_entries=INFERENCE_CACHE_ENTRIES,
+    ttl=INFERENCE_CACHE_TTL,
+    max_bytes=INFERENCE_CACHE_MAX_BYTES,
+)
+_counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+_shared_puts = 0
+
+def _stats() -> Dict[str, Any]:
+    return dict(_counters, shared_enabled=INFERENCE_CACHE_SHARED, memory=_memory.stats())
+
+metrics.register("inference_cache", _stats)
+
+
+def make_key(image_bytes: bytes, model_id: str, params: Dict[str, Any]) -> str:
+    """SHA-256 over the normalized (preprocessed) image bytes + model + output-affecting params"""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(model_id.encode("utf-8"))
+    for name in KEY_PARAMS:
+        digest.update(f"|{name}={params.get(name)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _shared_get(key: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=INFERENCE_CACHE_SHARED_TTL)
+        entry = db.query(InferenceCacheEntry).filter(
+            InferenceCacheEntry.cache_key == key,
+            InferenceCacheEntry.created_at > cutoff
+        ).first()
+        return entry.result if entry else None
+    finally:
+        db.close()
+
+
+def _shared_put(key: str, model_id: str, payload: str, prune: bool):
+    db = SessionLocal()
+    try:
+        db.merge(InferenceCacheEntry(
+            cache_key=key,
+            model_id=model_id,
+            result=payload,
+            created_at=datetime.utcnow()
+        ))
+        if prune:
+            cutoff = datetime.utcnow() - timedelta(seconds=INFERENCE_CACHE_SHARED_TTL)
+            db.query(InferenceCacheEntry).filter(InferenceCacheEntry.created_at <= cutoff).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached detector result; returns a fresh dict or None"""
+    payload = _memory.get(key)
+    if payload is not None:
+        _counters["memory_hits"] += 1
+        return json.loads(payload)
+    
+    if INFERENCE_CACHE_SHARED:
+        try:
+            payload = await run_io(_shared_get, key)
+        except Exception as e:
+            _counters["shared_errors"] += 1
+            print(f"⚠️ Shared inference cache read failed: {str(e)}")
+            payload = None
+        if payload is not None:
+            _counters["shared_hits"] += 1
+            _memory.set(key, payload, size=len(payload))
+            return json.loads(payload)
+    
+    _counters["misses"] += 1
+    return None
+
+
+async def put(key: str, model_id: str, result: Dict[str, Any]):
+    """Store a successful detector result in every enabled tier"""
+    global _shared_puts
+    payload = json.dumps(result)
+    _memory.set(key, payload, size=len(payload))
+    
+    if INFERENCE_CACHE_SHARED:
+        _shared_puts += 1
+        try:
+            await run_io(_shared_put, key, model_id, payload, _shared_puts % 100 == 0)
+        except Exception as e:
+            _counters["shared_errors"] += 1
+            print(f"⚠️ Shared inference cache write failed: {str(e)}")
@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+from uuid import uuid4
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException
+from services.cache import LRUCache
+from services import metrics
+
+# Opt-in background jobs for long requests (POST /api/analyze?mode=job):
+# the handler answers with a job id straight away and one of JOB_WORKERS
+# in-process workers does the work, reporting progress events as it goes.
+# Clients poll /api/jobs/{id} or follow /api/jobs/{id}/events (SSE).
+# Jobs are kept in memory only: finished ones expire after JOB_TTL, and
+# queued/running ones are failed on shutdown so clients know to resubmit.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_TTL = float(os.getenv("JOB_TTL", "900"))
+JOB_MAX_ENTRIES = int(os.getenv("JOB_MAX_ENTRIES", "5000"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "30"))
+JOB_KEEPALIVE_INTERVAL = float(os.getenv("JOB_KEEPALIVE_INTERVAL", "15"))
+
+
+class Job:
+    """One unit of background work plus the progress events it has reported"""
+    
+    def __init__(self, owner: Optional[str]):
+        self.id = uuid4().hex
+        self.owner = owner
+        self.status = "queued"
+        self.events: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self._changed = asyncio.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+    
+    def progress(self, stage: str, **data):
+        """Record a progress event; followers are woken up"""
+        self.events.append({"stage": stage, "at": time.time(), **data})
+        self._notify()
+    
+    def _start(self):
+        self.status = "running"
+        self._notify()
+    
+    def _finish(self, result: Any = None, error: Optional[Dict[str, Any]] = None):
+        self.status = "failed" if error else "done"
+        self.result = result
+        self.error = error
+        if error:
+            self.progress("failed", error=error)
+        else:
+            self.progress("done", result=result)
+    
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.events[-1]["stage"] if self.events else None,
+            "events": [{k: v for k, v in event.items() if k != "result"} for event in self.events],
+            "result": self.result,
+            "error": self.error,
+            "created_at": datetime.fromtimestamp(self.created_at),
+        }
+    
+    async def follow(self, keepalive: float = JOB_KEEPALIVE_INTERVAL) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield every event (already recorded ones first) until the job finishes.
+        Yields None after `keepalive` seconds without news.
+        """
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class JobQueue:
+    """Bounded in-process queue drained by a fixed number of worker tasks"""
+    
+    def __init__(self, name: str, workers: int, queue_size: int, ttl: float, max_entries: int):
+        self.name = name
+        self.workers = workers
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=queue_size)
+        self._jobs = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0}
+        metrics.register(name, self.stats)
+    
+    def submit(
+        self,
+        work: Callable[[Job], Awaitable[Any]],
+        owner: Optional[str] = None,
+        discard: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """
+        Queue `work(job)`; its return value becomes the job result. `discard`
+        is called instead if the job never gets to run (shutdown).
+        Raises 503 when the queue is full.
+        """
+        job = Job(owner)
+        try:
+            self._queue.put_nowait((job, work, discard))
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Server is busy, please try again shortly")
+        self._jobs.set(job.id, job)
+        self._counters["submitted"] += 1
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+    
+    def start(self):
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        """Let queued jobs finish for up to `timeout` seconds, then fail the rest"""
+        if not self._tasks:
+            return
+        if self._queue.qsize() or self._running:
+            print(f"⏳ Waiting for {self._queue.qsize() + self._running} {self.name}")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.name} drain timed out - failing the rest")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        while not self._queue.empty():
+            job, _, discard = self._queue.get_nowait()
+            if discard is not None:
+                discard()
+            job._finish(error={"status_code": 503, "detail": "Server restarted before the job ran, please resubmit"})
+    
+    async def _worker(self):
+        while True:
+            job, work, _ = await self._queue.get()
+            self._running += 1
+            job._start()
+            try:
+                result = await work(job)
+            except asyncio.CancelledError:
+                job._finish(error={"status_code": 503, "detail": "Server restarted while the job was running, please resubmit"})
+                raise
+            except HTTPException as e:
+                self._counters["failed"] += 1
+                job._finish(error={"status_code": e.status_code, "detail": e.detail})
+            except Exception as e:
+                self._counters["failed"] += 1
+                print(f"❌ Job {job.id} failed: {str(e)}")
+                job._finish(error={"status_code": 500, "detail": f"Job failed: {str(e)}"})
+            else:
+                self._counters["done"] += 1
+                job._finish(result=result)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self._counters,
+            queue_depth=self._queue.qsize(),
+            running=self._running,
+            workers=len(self._tasks),
+            jobs=len(self._jobs),
+        )
+
+analysis_jobs = JobQueue("analysis_jobs", JOB_WORKERS, JOB_QUEUE_SIZE, JOB_TTL, JOB_MAX_ENTRIES)
@@ -0,0 +1,12 @@
+from typing import Callable, Dict, Any
+
+# Named metric providers; each returns a dict snapshot when /metrics is hit
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Register a callable that returns the current metrics for a component"""
+    _providers[name] = provider
+
+def snapshot() -> Dict[str, Any]:
+    """Collect metrics from every registered component"""
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,274 @@
+import os
+import ast
+import time
+import hashlib
+import asyncio
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from PIL import Image
+from services.detectors import Detector
+from services.executor import run_cpu
+from services import inference_cache, metrics
+
+try:
+    import onnxruntime
+except ImportError:  # optional: only needed when a model is served by the onnx backend
+    onnxruntime = None
+
+# Local inference for YOLO-style ONNX exports (YOLOv5 / YOLOv8 heads).
+# Weights are loaded once at startup. Concurrent detect() calls are gathered
+# for up to ONNX_BATCH_WINDOW seconds into one session.run() of at most
+# ONNX_MAX_BATCH frames (if the export has a dynamic batch axis).
+# `confidence` / `overlap` mean what they mean for the Roboflow API:
+# minimum class score and per-class NMS IoU, both in percent.
+ONNX_INPUT_SIZE = int(os.getenv("ONNX_INPUT_SIZE", "640"))
+ONNX_MAX_BATCH = int(os.getenv("ONNX_MAX_BATCH", "8"))
+ONNX_BATCH_WINDOW = float(os.getenv("ONNX_BATCH_WINDOW", "0.005"))
+ONNX_MAX_DETECTIONS = int(os.getenv("ONNX_MAX_DETECTIONS", "300"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime's default
+
+LETTERBOX_FILL = (114, 114, 114)
+
+def letterbox(image_bytes: bytes, size: int) -> Tuple[np.ndarray, float, Tuple[int, int], Tuple[int, int]]:
+    """
+    Decode and fit an image into a size x size square (aspect kept, padded).
+    Returns (CHW float32 tensor in [0, 1], ratio, (pad_x, pad_y), (width, height)).
+    """
+    with Image.open(BytesIO(image_bytes)) as img:
+        img = img.convert("RGB")
+        width, height = img.size
+        ratio = min(size / width, size / height)
+        resized = img.resize((max(1, round(width * ratio)), max(1, round(height * ratio))), Image.BILINEAR)
+    
+    pad = ((size - resized.width) // 2, (size - resized.height) // 2)
+    canvas = Image.new("RGB", (size, size), LETTERBOX_FILL)
+    canvas.paste(resized, pad)
+    tensor = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return np.ascontiguousarray(tensor), ratio, pad, (width, height)
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS over xyxy boxes; returns the kept indices, best score first"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        inter = (
+            (np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest])).clip(0)
+            * (np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest])).clip(0)
+        )
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+def decode_yolo(
+    output: np.ndarray,
+    num_classes: int,
+    confidence: float,
+    overlap: float,
+    max_detections: int = ONNX_MAX_DETECTIONS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One frame of raw YOLO output -> (xyxy boxes, scores, class ids) after the
+    confidence cut and per-class NMS (thresholds as fractions). Accepts
+    YOLOv8 heads (4 box + class scores) and YOLOv5 heads (4 box + objectness
+    + class scores), as (anchors, attributes) or transposed.
+    """
+    attributes = (4 + num_classes, 5 + num_classes)
+    if output.shape[0] in attributes and output.shape[1] not in attributes:
+        output = output.T
+    if output.shape[1] == 4 + num_classes:
+        class_scores = output[:, 4:]
+    elif output.shape[1] == 5 + num_classes:
+        class_scores = output[:, 5:] * output[:, 4:5]
+    else:
+        raise ValueError(f"Unexpected model output shape {output.shape} for {num_classes} classes")
+    
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+    mask = scores >= confidence
+    centers, sizes = output[mask, :2], output[mask, 2:4]
+    boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+    scores, class_ids = scores[mask], class_ids[mask]
+    if not len(boxes):
+        return boxes, scores, class_ids
+    
+    # Per-class NMS in one pass: move each class into its own coordinate range
+    offsets = class_ids[:, None] * (boxes.max() + 1)
+    keep = nms(boxes + offsets, scores, overlap)[:max_detections]
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+def _weights_digest(path: str) -> str:
+    """Short content hash of a weights file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class OnnxDetector(Detector):
+    """YOLO-style ONNX model run in-process on the CPU pool"""
+    
+    backend = "onnx"
+    
+    def __init__(
+        self,
+        role: str,
+        model_path: Optional[str],
+        classes: Optional[str],
+        confidence: float,
+        overlap: float,
+        input_size: int = ONNX_INPUT_SIZE,
+        max_batch: int = ONNX_MAX_BATCH,
+        batch_window: float = ONNX_BATCH_WINDOW,
+    ):
+        super().__init__(role)
+        if not model_path:
+            raise RuntimeError(f"ONNX_{role.upper()}_MODEL is missing (path to the exported .onnx weights)")
+        self.model_path = model_path
+        self.model_id = f"onnx/{Path(model_path).stem}"
+        self.classes_setting = classes
+        self.class_names: List[str] = []
+        self.confidence = confidence
+        self.overlap = overlap
+        self.input_size = input_size
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._session = None
+        self._input_name = None
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._counters = {"frames": 0, "batches": 0}
+        metrics.register(f"detector_{role}", self.stats)
+    
+    def load(self):
+        if onnxruntime is None:
+            raise RuntimeError(f"{self.role} detector uses the onnx backend but onnxruntime is not installed")
+        # Cached results are keyed on the model id: re-exported weights under the same name must not hit them
+        self.model_id = f"onnx/{Path(self.model_path).stem}@{_weights_digest(self.model_path)}"
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self._session = onnxruntime.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        batch_axis, _, height, width = model_input.shape
+        if isinstance(height, int) and isinstance(width, int):
+            if height != width:
+                raise RuntimeError(f"{self.model_path}: only square inputs are supported, got {width}x{height}")
+            self.input_size = height
+        if isinstance(batch_axis, int):
+            self.max_batch = 1  # fixed-batch export: one frame per run
+        
+        self.class_names = self._load_class_names()
+        # Warm-up run so the first request doesn't pay for graph initialisation
+        self._run(np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32))
+        print(f"🧠 Loaded {self.model_path}: {len(self.class_names)} classes, input {self.input_size}, batch {self.max_batch}")
+    
+    def _load_class_names(self) -> List[str]:
+        """ONNX_<ROLE>_CLASSES (labels file or comma list), else the export's `names` metadata"""
+        if self.classes_setting:
+            if os.path.exists(self.classes_setting):
+                with open(self.classes_setting, encoding="utf-8") as f:
+                    return [line.strip() for line in f if line.strip()]
+            return [name.strip() for name in self.classes_setting.split(",") if name.strip()]
+        
+        names = self._session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            parsed = ast.literal_eval(names)  # e.g. "{0: 'Acne', 1: 'Pimples'}"
+            return [parsed[key] for key in sorted(parsed)] if isinstance(parsed, dict) else list(parsed)
+        raise RuntimeError(f"No class names for {self.model_path}: set ONNX_{self.role.upper()}_CLASSES")
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch})[0]
+    
+    async def detect(self, image_bytes: bytes, filename: str = "image.jpg") -> Dict[str, Any]:
+        params = {"confidence": self.confidence, "overlap": self.overlap}
+        cache_key = inference_cache.make_key(image_bytes, self.model_id, params)
+        cached = await inference_cache.get(cache_key)
+        if cached is not None:
+            print(f"⚡ Inference cache hit: {self.model_id}")
+            return cached
+        
+        started = time.perf_counter()
+        tensor, ratio, pad, size = await run_cpu(letterbox, image_bytes, self.input_size)
+        output = await self._infer(tensor)
+        result = await run_cpu(self._to_result, output, ratio, pad, size)
+        result["time"] = time.perf_counter() - started
+        print(f"🧠 Local {self.role} inference ({self.model_id}): {len(result['predictions'])} predictions in {result['time'] * 1000:.0f} ms")
+        
+        await inference_cache.put(cache_key, self.model_id, result)
+        return result
+    
+    def _to_result(self, output: np.ndarray, ratio: float, pad: Tuple[int, int], size: Tuple[int, int]) -> Dict[str, Any]:
+        boxes, scores, class_ids = decode_yolo(output, len(self.class_names), self.confidence / 100, self.overlap / 100)
+        # Letterbox square -> inference image pixels
+        width, height = size
+        boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        
+        predictions = []
+        for (x1, y1, x2, y2), score, class_id in zip(boxes.tolist(), scores.tolist(), class_ids.tolist()):
+            predictions.append({
+                "x": (x1 + x2) / 2,
+                "y": (y1 + y2) / 2,
+                "width": x2 - x1,
+                "height": y2 - y1,
+                "confidence": score,
+                "class": self.class_names[class_id],
+                "class_id": class_id,
+            })
+        return {"predictions": predictions, "image": {"width": width, "height": height}}
+    
+    async def _infer(self, tensor: np.ndarray) -> np.ndarray:
+        """Raw output for one frame, run together with whatever else arrives within the batch window"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tensor, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference so the running batch can't be garbage-collected
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        try:
+            outputs = await run_cpu(self._run, np.stack([tensor for tensor, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._counters["batches"] += 1
+        self._counters["frames"] += len(batch)
+        for output, (_, future) in zip(outputs, batch):
+            if not future.done():  # the caller may have timed out meanwhile
+                future.set_result(output)
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self._counters,
+            model=self.model_id,
+            max_batch=self.max_batch,
+            pending=len(self._pending),
+        )
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Any, Dict, Optional, Tuple
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from services import metrics
+
+# bcrypt cost factor. Changing it is safe: existing hashes are re-hashed at the
+# new cost the next time their owner logs in (see verify_and_update_async).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Dedicated worker processes so a burst of logins can't starve the cpu pool
+# (image work) or the event loop. Requests beyond the queue limit get a 503.
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(2, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "32"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+MAX_PASSWORD_BYTES = 72  # bcrypt ignores anything past this
+
+def check_password_length(password: str):
+    if len(password.encode('utf-8')) > MAX_PASSWORD_BYTES:
+        raise ValueError("Password is too long. Please use a shorter password.")
+
+# --- run inside the worker processes (module-level so they pickle) ---
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPool:
+    """Lazily started process pool with a cap on in-flight (running + queued) jobs"""
+    
+    def __init__(self, max_workers: int, queue_limit: int):
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_total = 0.0
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads (uvicorn, pools) is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+    
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many login requests in progress, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._in_flight += 1
+        
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed): start a fresh pool for the next caller
+            print("⚠️ Password worker pool broke - restarting")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._busy_total += time.perf_counter() - started
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_limit": self.queue_limit,
+                "started": self._executor is not None,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_ms": round(self._busy_total / self._completed * 1000, 3) if self._completed else 0.0,
+            }
+    
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_QUEUE_LIMIT)
+
+metrics.register("password_pool", password_pool.stats)
+
+async def hash_password_async(password: str) -> str:
+    """bcrypt hash in the password pool; raises ValueError for over-long passwords"""
+    check_password_length(password)
+    return await password_pool.run(_hash, password)
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify in the password pool. Returns (valid, new_hash); new_hash is set
+    when the stored hash uses an outdated scheme/cost and should be replaced.
+    """
+    return await password_pool.run(_verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,76 @@
+import os
+import time
+from typing import Any, Dict, Optional
+from fastapi import Request
+from services.cache import LRUCache
+from services import metrics
+
+# Failed login attempts allowed per window before further attempts get a 429
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+LOGIN_LIMITER_KEYS = int(os.getenv("LOGIN_LIMITER_KEYS", "10000"))
+
+# Reverse proxies in front of the app that append the caller's address to
+# X-Forwarded-For (Railway's edge: 1, set in railway.json's start command).
+# 0 = clients connect directly and the socket peer is the client. Behind a
+# proxy the peer is the proxy itself, and keying on it would make every
+# per-IP limit one global counter. Only the entry written by the outermost
+# trusted proxy is used: anything left of it is client-supplied and spoofable.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+def client_ip(request: Request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> Optional[str]:
+    """Caller's IP as seen by the outermost trusted proxy; None if it can't be established"""
+    if trusted_hops <= 0:
+        return request.client.host if request.client else None
+    forwarded = [
+        entry.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for entry in header.split(",")
+        if entry.strip()
+    ]
+    # Fewer entries than proxies: the request didn't come through the proxy chain
+    return forwarded[-trusted_hops] if len(forwarded) >= trusted_hops else None
+
+
+class AttemptLimiter:
+    """
+    Sliding-window failure counter per key (username, client IP, ...).
+    Timestamps live in an LRUCache so idle keys expire and memory stays bounded.
+    Meant to be used from the event loop only (read-modify-write isn't locked).
+    """
+    
+    def __init__(self, name: str, max_attempts: int, window: float, max_keys: int = 10000):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.window = window
+        self._attempts = LRUCache(max_entries=max_keys, ttl=window)
+        self._blocked = 0
+        metrics.register(f"limiter_{name}", self.stats)
+    
+    def _recent(self, key: str, now: float) -> tuple:
+        return tuple(t for t in self._attempts.get(key, ()) if now - t < self.window)
+    
+    def retry_after(self, key: str) -> float:
+        """Seconds until `key` may try again; 0 if it isn't limited"""
+        now = time.monotonic()
+        recent = self._recent(key, now)
+        if len(recent) < self.max_attempts:
+            return 0.0
+        self._blocked += 1
+        return recent[-self.max_attempts] + self.window - now
+    
+    def record_failure(self, key: str):
+        now = time.monotonic()
+        recent = self._recent(key, now)[-(self.max_attempts - 1):] if self.max_attempts > 1 else ()
+        self._attempts.set(key, recent + (now,))
+    
+    def reset(self, key: str):
+        self._attempts.pop(key)
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._attempts.stats(), max_attempts=self.max_attempts, window=self.window, blocked=self._blocked)
+
+login_user_limiter = AttemptLimiter("login_user", LOGIN_MAX_FAILURES_PER_USER, LOGIN_FAILURE_WINDOW, LOGIN_LIMITER_KEYS)
+login_ip_limiter = AttemptLimiter("login_ip", LOGIN_MAX_FAILURES_PER_IP, LOGIN_FAILURE_WINDOW, LOGIN_LIMITER_KEYS)
@@ -1,9 +1,32 @@
 import os
-import requests
-from typing import Dict, Any
+import asyncio
+from typing import Any, Dict, Tuple
+from services.http_client import post_with_retries_async, CircuitBreaker, CircuitOpenError
+from services import inference_cache
 
-def analyze_image(image_path: str) -> Dict[str, Any]:
-    """Primary acne detection model"""
+# Per-model timeouts in seconds (env-configurable)
+PRIMARY_TIMEOUT = float(os.getenv("ROBOFLOW_PRIMARY_TIMEOUT", "30"))
+SECONDARY_TIMEOUT = float(os.getenv("ROBOFLOW_SECONDARY_TIMEOUT", "20"))
+
+# Detection thresholds in Roboflow's units (percent). The local ONNX backend
+# (services.onnx_detector) applies the same values.
+PRIMARY_CONFIDENCE = 10
+PRIMARY_OVERLAP = 30
+SECONDARY_CONFIDENCE = 20
+SECONDARY_OVERLAP = 30
+
+# Base URL is overridable so a local stub server can stand in for Roboflow
+ROBOFLOW_API_URL = os.getenv("ROBOFLOW_API_URL", "https://detect.roboflow.com").rstrip("/")
+
+# The secondary model is optional: stop calling it for a while when it keeps failing
+secondary_breaker = CircuitBreaker(
+    "roboflow_secondary",
+    failure_threshold=int(os.getenv("ROBOFLOW_SECONDARY_BREAKER_FAILURES", "3")),
+    reset_timeout=float(os.getenv("ROBOFLOW_SECONDARY_BREAKER_RESET", "60")),
+)
+
+def _primary_request() -> Tuple[str, Dict[str, Any]]:
+    """Model id ("model/version") + query params for the primary acne detection model"""
     # ✅ Read env vars at runtime (after load_dotenv has run)
     api_key = os.getenv("ROBOFLOW_API_KEY")
     model = os.getenv("ROBOFLOW_MODEL")
@@ -14,32 +37,17 @@ def analyze_image(image_path: str) -> Dict[str, Any]:
     if not model:
         raise RuntimeError("ROBOFLOW_MODEL is missing (check your .env and load_dotenv).")
     
-    print(f"🔍 Analyzing image: {image_path}")
     print(f"📦 Using model: {model}/{version}")
     
-    url = f"https://detect.roboflow.com/{model}/{version}"
     params = {
         "api_key": api_key,
-        "confidence": 10,
-        "overlap": 30
+        "confidence": PRIMARY_CONFIDENCE,
+        "overlap": PRIMARY_OVERLAP
     }
-    
-    with open(image_path, "rb") as image_file:
-        response = requests.post(url, params=params, files={"file": image_file})
-    
-    print(f"🌐 Calling Roboflow API: {url}")
-    
-    if response.status_code == 200:
-        result = response.json()
-        print(f"📊 Predictions found: {len(result.get('predictions', []))}")
-        return result
-    
-    print(f"❌ Error: {response.text}")
-    raise Exception(f"Roboflow API error: {response.status_code} - {response.text}")
+    return f"{model}/{version}", params
 
-
-def analyze_secondary(image_path: str) -> Dict[str, Any]:
-    """Secondary skin condition detection model (acne-melasma-rosacea)"""
+def _secondary_request() -> Tuple[str, Dict[str, Any]]:
+    """Model id ("model/version") + query params for the secondary model (acne-melasma-rosacea)"""
     api_key = os.getenv("ROBOFLOW_API_KEY")
     
     # Hardcoded since you have the exact model ID
@@ -49,25 +57,80 @@ def analyze_secondary(image_path: str) -> Dict[str, Any]:
     if not api_key:
         raise RuntimeError("ROBOFLOW_API_KEY is missing.")
     
-    print(f"🔬 Running secondary analysis: {image_path}")
     print(f"📦 Using secondary model: {secondary_model}/{secondary_version}")
     
-    url = f"https://detect.roboflow.com/{secondary_model}/{secondary_version}"
     params = {
         "api_key": api_key,
-        "confidence": 20,
-        "overlap": 30
+        "confidence": SECONDARY_CONFIDENCE,
+        "overlap": SECONDARY_OVERLAP
     }
+    return f"{secondary_model}/{secondary_version}", params
+
+def _primary_result(response) -> Dict[str, Any]:
+    """Parse a primary model response"""
+    if response.status_code == 200:
+        result = response.json()
+        print(f"📊 Predictions found: {len(result.get('predictions', []))}")
+        return result
     
-    with open(image_path, "rb") as image_file:
-        response = requests.post(url, params=params, files={"file": image_file})
-    
-    print(f"🌐 Calling Secondary Roboflow API: {url}")
-    
+    print(f"❌ Error: {response.text}")
+    raise Exception(f"Roboflow API error: {response.status_code} - {response.text}")
+
+def _secondary_result(response) -> Dict[str, Any]:
+    """Parse a secondary model response"""
     if response.status_code == 200:
         result = response.json()
         print(f"📊 Secondary predictions found: {len(result.get('predictions', []))}")
         return result
     
     print(f"❌ Secondary model error: {response.text}")
-    raise Exception(f"Secondary Roboflow API error: {response.status_code} - {response.text}")
\ No newline at end of file
+    raise Exception(f"Secondary Roboflow API error: {response.status_code} - {response.text}")
+
+async def analyze_image_async(image_bytes: bytes, filename: str = "image.jpg") -> Dict[str, Any]:
+    """Primary acne detection model (non-blocking, cached)"""
+    model_id, params = _primary_request()
+    
+    cache_key = inference_cache.make_key(image_bytes, model_id, params)
+    cached = await inference_cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ Inference cache hit: {model_id}")
+        return cached
+    
+    url = f"{ROBOFLOW_API_URL}/{model_id}"
+    print(f"🌐 Calling Roboflow API: {url}")
+    response = await post_with_retries_async(url, PRIMARY_TIMEOUT, params=params, files={"file": (filename, image_bytes)})
+    
+    result = _primary_result(response)
+    await inference_cache.put(cache_key, model_id, result)
+    return result
+
+
+async def analyze_secondary_async(image_bytes: bytes, filename: str = "image.jpg") -> Dict[str, Any]:
+    """Secondary skin condition detection model (non-blocking, cached)"""
+    model_id, params = _secondary_request()
+    
+    cache_key = inference_cache.make_key(image_bytes, model_id, params)
+    cached = await inference_cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ Inference cache hit: {model_id}")
+        return cached
+    
+    if not secondary_breaker.allow():
+        raise CircuitOpenError("Secondary model circuit is open - skipping")
+    
+    url = f"{ROBOFLOW_API_URL}/{model_id}"
+    print(f"🌐 Calling Secondary Roboflow API: {url}")
+    try:
+        response = await post_with_retries_async(url, SECONDARY_TIMEOUT, params=params, files={"file": (filename, image_bytes)})
+        result = _secondary_result(response)
+    except asyncio.CancelledError:
+        # Timeouts in analyze_both are reported via RoboflowDetector.timed_out; other
+        # cancellations (primary failed, client went away) aren't the model's fault
+        secondary_breaker.record_cancelled()
+        raise
+    except Exception:
+        secondary_breaker.record_failure()
+        raise
+    secondary_breaker.record_success()
+    await inference_cache.put(cache_key, model_id, result)
+    return result
@@ -0,0 +1,173 @@
+from bisect import bisect_left
+from typing import Dict, Mapping, Sequence
+import numpy as np
+
+# Skin scores: every detected class costs a piecewise-linear penalty in its
+# count (the first detections at the full class weight, further ones at
+# tiered rates), the total is capped and subtracted from a base score.
+# Weights and tier tables are turned into arrays once here; scoring
+# thousands of summaries is then a handful of array operations. Single
+# summaries (a few classes each) read the same precomputed tables from
+# plain lists, where numpy's per-call overhead would cost more than the math.
+#
+# Results are bit-for-bit those of the original per-call implementations:
+# each term is evaluated with the same float operations in the same order,
+# and per-summary totals are accumulated left to right (no pairwise sums).
+# benchmarks/bench_scoring.py checks this against the original code.
+
+PRIMARY_WEIGHTS = {
+    'cystic': 8,
+    'purulent': 7,
+    'Acne': 6,
+    'conglobata': 8,
+    'Pimples': 5,
+    'papular': 5,
+    'whitehead': 4,
+    'blackhead': 4,
+    'acne_scars': 4,
+    'keloid': 5,
+    'folliculitis': 3,
+    'milium': 2,
+    'crystalline': 2,
+    'flat_wart': 3,
+    'syringoma': 2,
+    'sebo-crystan-conglo': 5,
+}
+PRIMARY_DEFAULT_WEIGHT = 4
+
+SECONDARY_WEIGHTS = {
+    'acne': 6,
+    'Acne': 6,
+    'melasma': 7,
+    'Melasma': 7,
+    'rosacea': 8,
+    'Rosacea': 8,
+}
+SECONDARY_DEFAULT_WEIGHT = 5
+
+# Primary-model classes that already account for a secondary 'acne' finding
+# when summaries haven't been through box fusion
+PRIMARY_ACNE_CLASSES = ('Acne', 'Pimples', 'papular', 'cystic', 'purulent', 'conglobata')
+
+BASE_SCORE = 95
+MIN_SCORE = 30
+MAX_SCORE = 95
+MAX_PENALTY = 70
+
+
+class PenaltyTable:
+    """
+    Per-class penalty curve. With breakpoints (2, 5) and rates (1.0, 1.2, 1.0)
+    a class of weight w costs w for each of its first 2 detections, w * 1.2
+    for the 3rd to 5th, and w for every one after that.
+    """
+    
+    def __init__(self, weights: Mapping[str, float], default_weight: float, breakpoints: Sequence[int], rates: Sequence[float]):
+        if len(rates) != len(breakpoints) + 1:
+            raise ValueError("need one rate per tier (len(breakpoints) + 1)")
+        self.class_index = {name: i for i, name in enumerate(weights)}
+        self.default_index = len(weights)  # last row: classes without their own weight
+        self.weights = np.array(list(weights.values()) + [default_weight], dtype=np.float64)
+        self.breakpoints = np.array(breakpoints, dtype=np.float64)
+        self.starts = np.array((0,) + tuple(breakpoints), dtype=np.float64)
+        self.rates = np.array(rates, dtype=np.float64)
+        
+        # slopes[class, tier]: cost per detection within `tier`
+        self.slopes = self.weights[:, None] * self.rates[None, :]
+        # bases[class, tier]: cost of all full tiers below `tier`
+        self.bases = np.zeros((len(self.weights), len(rates)))
+        for tier in range(1, len(rates)):
+            length = self.starts[tier] - self.starts[tier - 1]
+            self.bases[:, tier] = self.bases[:, tier - 1] + (length * self.weights) * self.rates[tier - 1]
+        
+        self._breakpoint_list = list(breakpoints)
+        self._start_list = self.starts.tolist()
+        self._slope_rows = self.slopes.tolist()
+        self._base_rows = self.bases.tolist()
+    
+    def penalties(self, classes: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Penalty of each (class index, count) pair"""
+        tiers = np.searchsorted(self.breakpoints, counts, side="left")
+        return self.bases[classes, tiers] + (counts - self.starts[tiers]) * self.slopes[classes, tiers]
+    
+    def total(self, summary: Mapping[str, int]) -> float:
+        """Summed penalty of one summary"""
+        total = 0
+        for name, count in summary.items():
+            row = self.class_index.get(name, self.default_index)
+            tier = bisect_left(self._breakpoint_list, count)
+            total += self._base_rows[row][tier] + (count - self._start_list[tier]) * self._slope_rows[row][tier]
+        return total
+    
+    def totals(self, summaries: Sequence[Mapping[str, int]]) -> np.ndarray:
+        """Summed penalty per summary, accumulated in each summary's own key order"""
+        lengths = np.fromiter(map(len, summaries), dtype=np.intp, count=len(summaries))
+        cells = int(lengths.sum())
+        index, default = self.class_index, self.default_index
+        classes = np.fromiter((index.get(name, default) for summary in summaries for name in summary), dtype=np.intp, count=cells)
+        counts = np.fromiter((count for summary in summaries for count in summary.values()), dtype=np.float64, count=cells)
+        
+        # One row per summary, classes left-aligned, zero padding (adds nothing)
+        rows = np.repeat(np.arange(len(summaries)), lengths)
+        cols = np.arange(cells) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        grid = np.zeros((len(summaries), int(lengths.max(initial=0))))
+        grid[rows, cols] = self.penalties(classes, counts)
+        
+        totals = np.zeros(len(summaries))
+        for col in range(grid.shape[1]):
+            totals += grid[:, col]
+        return totals
+    
+    def score(self, summary: Mapping[str, int], max_penalty: float = MAX_PENALTY) -> int:
+        """Capped penalty subtracted from the base score, truncated and clamped"""
+        return max(MIN_SCORE, min(MAX_SCORE, int(BASE_SCORE - min(self.total(summary), max_penalty))))
+    
+    def scores(self, summaries: Sequence[Mapping[str, int]], max_penalty: float = MAX_PENALTY) -> np.ndarray:
+        """score() for many summaries at once"""
+        final = BASE_SCORE - np.minimum(self.totals(summaries), max_penalty)
+        return np.clip(np.trunc(final), MIN_SCORE, MAX_SCORE).astype(int)
+
+PRIMARY_TABLE = PenaltyTable(PRIMARY_WEIGHTS, PRIMARY_DEFAULT_WEIGHT, (2, 5, 10), (1.0, 1.2, 1.0, 0.8))
+SECONDARY_TABLE = PenaltyTable(SECONDARY_WEIGHTS, SECONDARY_DEFAULT_WEIGHT, (2, 5), (1.0, 1.2, 1.0))
+
+def skin_score(summary: Mapping[str, int]) -> int:
+    return PRIMARY_TABLE.score(summary)
+
+def secondary_score(summary: Mapping[str, int]) -> int:
+    return SECONDARY_TABLE.score(summary)
+
+def skin_scores(summaries: Sequence[Mapping[str, int]]) -> np.ndarray:
+    """Primary-model scores for many detection summaries at once"""
+    return PRIMARY_TABLE.scores(summaries)
+
+def secondary_scores(summaries: Sequence[Mapping[str, int]]) -> np.ndarray:
+    """Secondary-model scores for many detection summaries at once"""
+    return SECONDARY_TABLE.scores(summaries)
+
+def unique_secondary(primary_summary: Mapping[str, int], secondary_summary: Mapping[str, int], fused: bool = False) -> Dict[str, int]:
+    """
+    Secondary conditions that add to the primary score. Without box fusion a
+    secondary 'acne' is assumed to be the same lesions as any primary acne.
+    """
+    if fused or not any(name in primary_summary for name in PRIMARY_ACNE_CLASSES):
+        return dict(secondary_summary)
+    return {name: count for name, count in secondary_summary.items() if name.lower() != 'acne'}
+
+def combined_score(primary_score: int, primary_summary: Mapping[str, int], secondary_summary: Mapping[str, int], fused: bool = False) -> int:
+    """Primary score lowered by the (uncapped) penalty of the unique secondary conditions"""
+    penalty = SECONDARY_TABLE.total(unique_secondary(primary_summary, secondary_summary, fused))
+    return max(MIN_SCORE, min(MAX_SCORE, primary_score - int(penalty)))
+
+def combined_scores(
+    primary_scores: Sequence[int],
+    primary_summaries: Sequence[Mapping[str, int]],
+    secondary_summaries: Sequence[Mapping[str, int]],
+    fused: bool = False,
+) -> np.ndarray:
+    """combined_score() for many images at once"""
+    unique = [
+        unique_secondary(primary_summary, secondary_summary, fused)
+        for primary_summary, secondary_summary in zip(primary_summaries, secondary_summaries)
+    ]
+    combined = np.asarray(primary_scores, dtype=np.int64) - np.trunc(SECONDARY_TABLE.totals(unique)).astype(np.int64)
+    return np.clip(combined, MIN_SCORE, MAX_SCORE)
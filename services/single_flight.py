@@ -0,0 +1,76 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import HTTPException
+from services.cache import LRUCache
+from services import metrics
+
+# Request de-duplication for expensive calls (double taps, client retries):
+# while a call for a key is running, identical calls await the same task
+# instead of starting their own; once it succeeds its result is replayed
+# for ANALYZE_REPLAY_WINDOW seconds. Failures are not kept, so a retry
+# after an error runs again. Per process only.
+ANALYZE_REPLAY_WINDOW = float(os.getenv("ANALYZE_REPLAY_WINDOW", "120"))
+ANALYZE_REPLAY_ENTRIES = int(os.getenv("ANALYZE_REPLAY_ENTRIES", "1000"))
+
+
+class SingleFlight:
+    """At most one running call per key, with a short replay window for results"""
+    
+    def __init__(self, name: str, window: float, max_entries: int):
+        self.name = name
+        self._inflight: Dict[Hashable, Tuple[asyncio.Task, Optional[str]]] = {}
+        self._done = LRUCache(max_entries=max_entries, ttl=window)
+        self._counters = {"calls": 0, "joined": 0, "replayed": 0}
+        metrics.register(name, self.stats)
+    
+    async def run(
+        self,
+        key: Hashable,
+        work: Callable[[], Awaitable[Any]],
+        fingerprint: Optional[str] = None,
+        discard: Optional[Callable[[], None]] = None,
+    ) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared); shared is True when the result came from
+        another call. `fingerprint` identifies the payload behind the key:
+        reusing a key for a different payload is a 422. `discard` is called
+        when `work` is not used (its resources are then the caller's to free).
+        
+        `work` runs as its own task, so a caller that disconnects doesn't
+        cancel it for the others.
+        """
+        replay = self._done.get(key)
+        running = self._inflight.get(key)
+        if replay is not None or running is not None:
+            if discard is not None:
+                discard()
+            if replay is not None:
+                self._check(fingerprint, replay[1])
+                self._counters["replayed"] += 1
+                return replay[0], True
+            self._check(fingerprint, running[1])
+            self._counters["joined"] += 1
+            return await asyncio.shield(running[0]), True
+        
+        task = asyncio.ensure_future(work())
+        self._inflight[key] = (task, fingerprint)
+        self._counters["calls"] += 1
+        task.add_done_callback(lambda done: self._settle(key, fingerprint, done))
+        return await asyncio.shield(task), False
+    
+    def _check(self, fingerprint: Optional[str], existing: Optional[str]):
+        if fingerprint != existing:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    
+    def _settle(self, key: Hashable, fingerprint: Optional[str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:  # also marks a failure as retrieved when nobody awaited it
+            self._done.set(key, (task.result(), fingerprint))
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._counters, inflight=len(self._inflight), replay=self._done.stats())
+
+analysis_flights = SingleFlight("analysis_dedup", ANALYZE_REPLAY_WINDOW, ANALYZE_REPLAY_ENTRIES)
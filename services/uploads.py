@@ -0,0 +1,203 @@
+import os
+import io
+import mmap
+import hashlib
+import tempfile
+from typing import BinaryIO, List, Optional, Tuple
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from services.executor import run_io
+
+# Uploads stay in memory up to this size; bigger bodies spill to an anonymous temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(4 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Hard cap on a single image upload (bytes)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# Multipart framing/headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# ISO-BMFF brands pillow_heif decodes as HEIC/HEIF
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Identify the real image format from its magic bytes; None if unsupported"""
+    if header[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS:
+        return "heic"
+    return None
+
+class UploadBuffer:
+    """
+    Request body shared by every pipeline stage.
+    In-memory bodies are a single immutable bytes object, so open() and view()
+    hand out zero-copy BytesIO/memoryview wrappers instead of duplicating it.
+    """
+    
+    def __init__(self, data: Optional[bytes] = None, spill: Optional[BinaryIO] = None, size: int = 0, format: Optional[str] = None):
+        self._data = data
+        self._spill = spill
+        self._mmap: Optional[mmap.mmap] = None
+        self.size = size
+        self.format = format
+    
+    @property
+    def spilled(self) -> bool:
+        return self._spill is not None
+    
+    def view(self) -> memoryview:
+        """Read-only view of the whole body (mmap-backed when spilled)"""
+        if self._spill is None:
+            return memoryview(self._data)
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._spill.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+    
+    def open(self) -> BinaryIO:
+        """File-like object positioned at the start of the body (e.g. for PIL)"""
+        if self._spill is None:
+            return io.BytesIO(self._data)
+        self._spill.seek(0)
+        return self._spill
+    
+    def sha256(self) -> str:
+        """Hex SHA-256 of the body (CPU-bound for large bodies: run it off the loop)"""
+        return hashlib.sha256(self.view()).hexdigest()
+    
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._data = None
+
+
+async def read_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    spool_threshold: int = UPLOAD_SPOOL_THRESHOLD
+) -> UploadBuffer:
+    """
+    Read an UploadFile in chunks, keeping it in memory unless it crosses `spool_threshold`.
+    The format is sniffed from the first chunk and the byte cap is enforced while
+    reading, so bogus or oversized payloads are rejected before anything is decoded.
+    """
+    chunks: List[bytes] = []
+    spill: Optional[BinaryIO] = None
+    size = 0
+    image_format = None
+    
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            
+            if image_format is None:
+                image_format = sniff_format(chunk[:16])
+                if image_format is None:
+                    raise HTTPException(status_code=415, detail="File must be an image (JPG, PNG, HEIC, WebP)")
+            
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Image is too large (max {max_bytes // (1024 * 1024)} MB)")
+            
+            if spill is None and size > spool_threshold:
+                spill = tempfile.TemporaryFile()
+                await run_io(spill.writelines, chunks)
+                chunks = []
+            
+            if spill is not None:
+                await run_io(spill.write, chunk)
+            else:
+                chunks.append(chunk)
+    except HTTPException:
+        if spill is not None:
+            spill.close()
+        raise
+    
+    if image_format is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    
+    if spill is not None:
+        await run_io(spill.flush)
+        print(f"💽 Upload spilled to disk ({size // 1024} KB)")
+        return UploadBuffer(spill=spill, size=size, format=image_format)
+    
+    return UploadBuffer(data=chunks[0] if len(chunks) == 1 else b"".join(chunks), size=size, format=image_format)
+
+
+class UploadTooLarge(HTTPException):
+    """Raised from the request's receive channel once the body passes its cap"""
+    
+    def __init__(self, detail: str):
+        super().__init__(status_code=413, detail=detail)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Cap upload request bodies with a 413. A declared Content-Length over the cap
+    is rejected before the body is read at all; other bodies (e.g. chunked) are
+    counted as they arrive and reading stops once they pass the cap, so no more
+    than `max_body` bytes are ever buffered or spooled for a request.
+    """
+    
+    def __init__(self, app, paths: Tuple[str, ...], max_body: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, detail: Optional[str] = None):
+        self.app = app
+        self.paths = paths
+        self.max_body = max_body
+        self.detail = detail or f"Image is too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        try:
+            too_large = content_length is not None and int(content_length) > self.max_body
+        except ValueError:
+            too_large = False
+        if too_large:
+            await self._reject(scope, receive, send)
+            return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # An HTTPException, so FastAPI's body parsing passes it through as a 413
+                    raise UploadTooLarge(self.detail)
+            return message
+        
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+    
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": self.detail},
+            status_code=413
+        )
+        await response(scope, receive, send)
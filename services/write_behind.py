@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, DataError
+from database import AsyncSessionLocal, Analysis
+from services.executor import run_io
+from services import metrics
+
+# Analysis rows are persisted after the response has gone out: handlers
+# enqueue plain dicts, one background task inserts them in multi-row
+# transactions; rows enqueued together (a group) always share one. Batches
+# the DB can't take right now are appended to a local JSONL spool and replayed once it's reachable again (and on next startup).
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.2"))
+WRITE_BEHIND_RETRY_INTERVAL = float(os.getenv("WRITE_BEHIND_RETRY_INTERVAL", "5"))
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "10"))
+WRITE_BEHIND_SPOOL_PATH = os.getenv("WRITE_BEHIND_SPOOL_PATH", "write_behind_spool.jsonl")
+
+Group = List[Dict[str, Any]]
+
+def _to_json(group: Group) -> str:
+    return json.dumps([{**record, "created_at": record["created_at"].isoformat()} for record in group])
+
+def _from_json(line: str) -> Group:
+    group = json.loads(line)
+    if isinstance(group, dict):
+        group = [group]  # single-row lines
+    for record in group:
+        record["created_at"] = datetime.fromisoformat(record["created_at"])
+    return group
+
+def _append_spool(path: str, groups: List[Group]):
+    """One line per group, so a replayed group is still inserted as a unit"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(_to_json(g) + "\n" for g in groups)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _take_spool(path: str) -> List[Group]:
+    """
+    Move the spool aside to <path>.replaying and read it. The replaying file
+    is only removed by _finish_replay, so a crash mid-replay re-reads it on
+    the next start (rows may then be inserted twice, never lost).
+    """
+    replaying = path + ".replaying"
+    if not os.path.exists(replaying):
+        if not os.path.exists(path):
+            return []
+        os.replace(path, replaying)
+    
+    groups = []
+    with open(replaying, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                groups.append(_from_json(line))
+            except (ValueError, KeyError, TypeError):
+                # A torn last line from a crash mid-append
+                print(f"⚠️ Skipping unreadable spool line: {line[:80]!r}")
+    return groups
+
+def _batches(groups: List[Group], batch_size: int):
+    """Pack whole groups into batches of roughly batch_size rows"""
+    batch, rows = [], 0
+    for group in groups:
+        if batch and rows + len(group) > batch_size:
+            yield batch
+            batch, rows = [], 0
+        batch.append(group)
+        rows += len(group)
+    if batch:
+        yield batch
+
+def _finish_replay(path: str) -> bool:
+    """Drop the replayed file; returns whether new rows were spooled meanwhile"""
+    replaying = path + ".replaying"
+    if os.path.exists(replaying):
+        os.remove(replaying)
+    return os.path.exists(path)
+
+
+class AnalysisWriter:
+    """Batched, spool-backed writer for Analysis rows"""
+    
+    def __init__(self, spool_path: str, queue_size: int, batch_size: int, flush_interval: float):
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue[Group]" = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._spool_lock = asyncio.Lock()
+        self._overflow_tasks = set()
+        self._spool_pending = os.path.exists(spool_path) or os.path.exists(spool_path + ".replaying")
+        self._next_replay = 0.0
+        self._counters = {"enqueued": 0, "written": 0, "batches": 0, "failed_batches": 0, "spooled": 0, "replayed": 0, "dropped": 0}
+        # Exception class only: /metrics is public and DB error strings carry the SQL and row values
+        self._last_error_type: Optional[str] = None
+    
+    def enqueue(self, record: Dict[str, Any]):
+        """Queue an Analysis row (column -> value dict); never blocks the request"""
+        self.enqueue_group([record])
+    
+    def enqueue_group(self, records: Group):
+        """Queue rows that must be committed together (all or none)"""
+        if not records:
+            return
+        group = list(records)
+        self._counters["enqueued"] += len(group)
+        try:
+            self._queue.put_nowait(group)
+        except asyncio.QueueFull:
+            # Don't lose it or hold up the response: hand it straight to the spool
+            task = asyncio.get_running_loop().create_task(self._spool([group]))
+            self._overflow_tasks.add(task)
+            task.add_done_callback(self._overflow_tasks.discard)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT):
+        """Flush everything still queued; whatever doesn't make it in time goes to the spool"""
+        if self._task is None:
+            return
+        if not self._queue.empty():
+            print(f"💾 Draining {self._queue.qsize()} queued analyses")
+        try:
+            # join() returns once every queued group has been written or spooled
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("⚠️ Analysis writer drain timed out - spooling the rest")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        
+        if self._overflow_tasks:
+            await asyncio.gather(*self._overflow_tasks, return_exceptions=True)
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            await self._spool(pending)
+    
+    async def _run(self):
+        await self._maybe_replay()
+        while True:
+            try:
+                group = await asyncio.wait_for(self._queue.get(), timeout=WRITE_BEHIND_RETRY_INTERVAL)
+            except asyncio.TimeoutError:
+                await self._maybe_replay()
+                continue
+            
+            batch = [group]
+            rows = len(group)
+            try:
+                # Gather whatever else arrives within flush_interval into the same transaction
+                deadline = time.monotonic() + self.flush_interval
+                while rows < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        group = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(group)
+                    rows += len(group)
+                
+                await self._insert([record for group in batch for record in group])
+            except asyncio.CancelledError:
+                # Drain timed out mid-batch: spool it (may duplicate if the commit had landed)
+                await asyncio.shield(self._spool(batch))
+                raise
+            except Exception as e:
+                self._counters["failed_batches"] += 1
+                self._last_error_type = type(e).__name__
+                print(f"⚠️ Analysis batch insert failed, spooling {rows} rows: {str(e)}")
+                await self._spool(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            await self._maybe_replay()
+    
+    async def _insert(self, records: List[Dict[str, Any]]):
+        """One multi-row INSERT in one transaction; on a bad row fall back to row-by-row"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Analysis), records)
+                await db.commit()
+        except (IntegrityError, DataError):
+            # e.g. the user row is gone: retrying would fail forever, so keep the good rows only
+            for record in records:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(insert(Analysis), [record])
+                        await db.commit()
+                    self._counters["written"] += 1
+                except (IntegrityError, DataError) as e:
+                    self._counters["dropped"] += 1
+                    print(f"⚠️ Dropping analysis row for user {record.get('user_id')}: {str(e)}")
+        else:
+            self._counters["written"] += len(records)
+        self._counters["batches"] += 1
+    
+    async def _spool(self, groups: List[Group]):
+        async with self._spool_lock:
+            await run_io(_append_spool, self.spool_path, groups)
+            self._spool_pending = True
+            self._counters["spooled"] += sum(len(g) for g in groups)
+            self._next_replay = time.monotonic() + WRITE_BEHIND_RETRY_INTERVAL
+    
+    async def _maybe_replay(self):
+        if not self._spool_pending or time.monotonic() < self._next_replay:
+            return
+        async with self._spool_lock:
+            groups = await run_io(_take_spool, self.spool_path)
+            self._spool_pending = False
+        
+        done = 0
+        replayed = 0
+        for batch in _batches(groups, self.batch_size):
+            try:
+                await self._insert([record for group in batch for record in group])
+            except Exception as e:
+                # Still down: re-spool only what hasn't been written yet
+                self._last_error_type = type(e).__name__
+                print(f"⚠️ Spool replay failed, retrying later: {str(e)}")
+                await self._spool(groups[done:])
+                break
+            done += len(batch)
+            replayed += sum(len(g) for g in batch)
+        self._counters["replayed"] += replayed
+        if replayed:
+            print(f"💾 Replayed {replayed} spooled analyses")
+        
+        async with self._spool_lock:
+            if await run_io(_finish_replay, self.spool_path):
+                self._spool_pending = True
+    
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self._counters,
+            queue_depth=self._queue.qsize(),
+            running=self._task is not None,
+            spool_pending=self._spool_pending,
+            last_error_type=self._last_error_type,
+        )
+
+analysis_writer = AnalysisWriter(
+    WRITE_BEHIND_SPOOL_PATH,
+    WRITE_BEHIND_QUEUE_SIZE,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+)
+
+metrics.register("analysis_writer", analysis_writer.stats)